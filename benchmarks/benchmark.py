@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of the hot path of clidoc.
+
+Each case times following phases of a parse separately:
+
+* ``tokenize``: :meth:`Parser.tokenize`, i.e. :class:`ArgvPreprocessor`.
+* ``match``: :meth:`Parser.create_manager` and :meth:`Parser.match`.
+* ``outcome``: :meth:`MatchStateManager.get_outcome`.
+
+Batch cases time parsing a log of argv of a generated doc, by calling
+:meth:`Parser.parse` per argv (``parse``) and by
+:meth:`Parser.parse_many` (``parse_many``), and report the throughput.
+
+Cases cover every generated doc in the tests directory, synthetic docs
+scaled by number of options (N), usage lines (M) and arguments (K), and
+an oom bound option repeated (R) times, and a ``LogicXor`` repeated by
+``LogicOneOrMore`` over (K) arguments.
+Results are stored as JSON and compared against a saved baseline.
+"""
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+TESTS_DIRECTORY = os.path.join(PROJECT_DIRECTORY, 'tests')
+
+sys.path.insert(0, PROJECT_DIRECTORY)
+
+from clidoc.codegen import (Token, Info, Parser, PosixOption, GnuOption,
+                            Command, Argument, LogicAnd, LogicXor, LogicOr,
+                            LogicOptional, LogicOneOrMore, Doc,
+                            SYSTEM_EXIT_OFF, PRINT_DOC_OFF)
+
+
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS_DIRECTORY, 'results.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIRECTORY, 'baseline.json')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# valid input of generated docs, keyed by the name of doc.
+GENERATED_DOC_ARGV = {
+    'argument': ['utility_name', 'flag-1', 'a', 'b'],
+    'command': ['utility_name', 'what-ever'],
+    'default_value': ['utility_name', 'flag-a', '-a', 'value'],
+    'logic': ['utility_name', '-or', 'flag-opqr'],
+    'option_binding': ['utility_name', '-e', 'a', 'command', '-e', 'b', 'c'],
+    'simple_option': ['utility_name', '--long-1'],
+}
+# argv rejected by every generated doc.
+INVALID_ARGV = ['utility_name', '--no-such-option']
+# number of argv in the log of a batch case.
+BATCH_SIZE = 1000
+
+
+def load_module(name, path):
+    """Load a module by path.
+
+    :param name: name of the module
+    :param path: path of the module
+    :return: the module
+    """
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Case(object):
+    """A benchmark case, parsing `argv` with `parser`."""
+
+    def __init__(self, name, parser, argv):
+        self.name = name
+        self.parser = parser
+        self.argv = argv
+
+    def phases(self):
+        """Return a list of ``(phase_name, function)`` to be timed.
+
+        :raise ValueError: if `argv` is rejected by the parser
+        """
+        parser = self.parser
+        argv = self.argv
+        tokens = parser.tokenize(argv)
+        manager = parser.create_manager(tokens)
+        if not (parser.match(manager) and manager.all_match()):
+            raise ValueError('{0}: invalid argv.'.format(self.name))
+
+        def match():
+            parser.match(parser.create_manager(tokens))
+
+        return [
+            ('tokenize', lambda: parser.tokenize(argv)),
+            ('match', match),
+            ('outcome', manager.get_outcome),
+        ]
+
+
+class BatchCase(object):
+    """A throughput case, parsing every argv of `argv_list` with `parser`."""
+
+    def __init__(self, name, parser, argv_list):
+        self.name = name
+        self.parser = parser
+        self.argv_list = argv_list
+
+    def phases(self):
+        """Return a list of ``(phase_name, function)`` to be timed."""
+        parser = self.parser
+        argv_list = self.argv_list
+        mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+
+        def parse():
+            for argv in argv_list:
+                parser.parse(argv, mode)
+
+        def parse_many():
+            for _ in parser.parse_many(argv_list):
+                pass
+
+        return [('parse', parse), ('parse_many', parse_many)]
+
+
+def generated_doc_parsers():
+    """Yield ``(doc_name, parser)`` of generated docs with valid argv."""
+    pattern = os.path.join(TESTS_DIRECTORY, 'clidoc_*.py')
+    for path in sorted(glob.glob(pattern)):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        doc_name = module_name[len('clidoc_'):]
+        if doc_name not in GENERATED_DOC_ARGV:
+            continue
+        module = load_module(module_name, path)
+        yield doc_name, module.Parser(module.Info)
+
+
+def generated_doc_cases():
+    for doc_name, parser in generated_doc_parsers():
+        yield Case('doc-' + doc_name, parser, GENERATED_DOC_ARGV[doc_name])
+
+
+def batch_cases():
+    # a log of valid and invalid argv, 3 to 1.
+    for doc_name, parser in generated_doc_parsers():
+        argv = GENERATED_DOC_ARGV[doc_name]
+        argv_list = [argv, argv, argv, INVALID_ARGV] * (BATCH_SIZE // 4)
+        yield BatchCase('batch-' + doc_name, parser, argv_list)
+
+
+def build_synthetic_info(num_options, num_usage_lines):
+    """Build grammar of following doc::
+
+        Usage:
+          utility_name cmd-0 [--opt-0 | ... | --opt-<N-1>]... <file>...
+          ...
+          utility_name cmd-<M-1> [--opt-0 | ... | --opt-<N-1>]... <file>...
+
+    :return: a subclass of :class:`Info`
+    """
+    options = [
+        Token(Token.GNU_OPTION, '--opt-{0}'.format(index))
+        for index in range(num_options)
+    ]
+    commands = [
+        Token(Token.COMMAND, 'cmd-{0}'.format(index))
+        for index in range(num_usage_lines)
+    ]
+    files = Token(Token.ARGUMENT, '<file>')
+
+    logic_xor = LogicXor()
+    for command in commands:
+        logic_or = LogicOr()
+        for option in options:
+            logic_or.add_child(GnuOption(option.value))
+        optional_options = LogicOptional()
+        optional_options.add_child(logic_or)
+        one_or_more_files = LogicOneOrMore()
+        one_or_more_files.add_child(Argument(files.value))
+
+        logic_and = LogicAnd()
+        logic_and.add_child(Command(command.value))
+        logic_and.add_child(optional_options)
+        logic_and.add_child(one_or_more_files)
+        logic_xor.add_child(logic_and)
+    doc = Doc()
+    doc.add_child(logic_xor)
+
+    class SyntheticInfo(Info):
+        doc_node = doc
+        bound_options = set()
+        unbound_options = set(options)
+        arguments = set()
+        oom_bound_options = set()
+        oom_arguments = set([files])
+        commands = None
+        default_values = {}
+        option_to_representative_option = dict(
+            (option, option) for option in options
+        )
+        doc_text = 'Usage:'
+    SyntheticInfo.commands = set(commands)
+    return SyntheticInfo
+
+
+def synthetic_case(num_options, num_usage_lines, num_arguments):
+    parser = Parser(build_synthetic_info(num_options, num_usage_lines))
+    # use the last usage line, and every other option.
+    argv = ['utility_name', 'cmd-{0}'.format(num_usage_lines - 1)]
+    argv.extend(
+        '--opt-{0}'.format(index) for index in range(0, num_options, 2)
+    )
+    argv.extend('file-{0}'.format(index) for index in range(num_arguments))
+    name = 'synthetic-n{0}-m{1}-k{2}'.format(
+        num_options, num_usage_lines, num_arguments,
+    )
+    return Case(name, parser, argv)
+
+
+def synthetic_cases():
+    yield synthetic_case(10, 10, 1)
+    # scaled by number of options.
+    yield synthetic_case(100, 10, 1)
+    # scaled by number of usage lines.
+    yield synthetic_case(10, 100, 1)
+    # scaled by number of arguments.
+    yield synthetic_case(10, 10, 1000)
+    yield synthetic_case(10, 10, 10000)
+
+
+def build_oom_info():
+    """Build grammar of following doc::
+
+        Usage:
+          utility_name (-I <dir>...)... [<file>...]
+
+    :return: a subclass of :class:`Info`
+    """
+    include = Token(Token.POSIX_OPTION, '-I')
+    files = Token(Token.ARGUMENT, '<file>')
+
+    one_or_more_includes = LogicOneOrMore()
+    one_or_more_includes.add_child(PosixOption(include.value))
+    one_or_more_files = LogicOneOrMore()
+    one_or_more_files.add_child(Argument(files.value))
+    optional_files = LogicOptional()
+    optional_files.add_child(one_or_more_files)
+
+    logic_and = LogicAnd()
+    logic_and.add_child(one_or_more_includes)
+    logic_and.add_child(optional_files)
+    doc = Doc()
+    doc.add_child(logic_and)
+
+    class OomInfo(Info):
+        doc_node = doc
+        bound_options = set()
+        unbound_options = set()
+        arguments = set()
+        oom_bound_options = set([include])
+        oom_arguments = set([files])
+        commands = set()
+        default_values = {}
+        option_to_representative_option = {include: include}
+        doc_text = 'Usage:'
+    return OomInfo
+
+
+def oom_case(num_repetitions):
+    parser = Parser(build_oom_info())
+    argv = ['utility_name']
+    argv.extend(['-I', 'a', 'b', 'c', '-I', 'd', 'e'] * num_repetitions)
+    return Case('oom-r{0}'.format(num_repetitions), parser, argv)
+
+
+def oom_cases():
+    # scaled by repetitions of `-I a b c -I d e`.
+    yield oom_case(1000)
+    yield oom_case(10000)
+
+
+def build_nested_xor_info():
+    """Build grammar of following doc::
+
+        Usage:
+          utility_name (<x> | -v)...
+
+    :return: a subclass of :class:`Info`
+    """
+    verbose = Token(Token.POSIX_OPTION, '-v')
+    x = Token(Token.ARGUMENT, '<x>')
+
+    logic_xor = LogicXor()
+    logic_xor.add_child(Argument(x.value))
+    logic_xor.add_child(PosixOption(verbose.value))
+    one_or_more = LogicOneOrMore()
+    one_or_more.add_child(logic_xor)
+    doc = Doc()
+    doc.add_child(one_or_more)
+
+    class NestedXorInfo(Info):
+        doc_node = doc
+        bound_options = set()
+        unbound_options = set([verbose])
+        arguments = set([x])
+        oom_bound_options = set()
+        oom_arguments = set()
+        commands = set()
+        default_values = {}
+        option_to_representative_option = {verbose: verbose}
+        doc_text = 'Usage:'
+    return NestedXorInfo
+
+
+def nested_xor_case(num_arguments):
+    parser = Parser(build_nested_xor_info())
+    argv = ['utility_name', '-v']
+    argv.extend('a{0}'.format(index) for index in range(num_arguments))
+    return Case('nested-xor-k{0}'.format(num_arguments), parser, argv)
+
+
+def nested_xor_cases():
+    # scaled by iterations of a `LogicXor` under `LogicOneOrMore`.
+    yield nested_xor_case(2000)
+    yield nested_xor_case(8000)
+
+
+def all_cases():
+    for case in generated_doc_cases():
+        yield case
+    for case in synthetic_cases():
+        yield case
+    for case in oom_cases():
+        yield case
+    for case in nested_xor_cases():
+        yield case
+    for case in batch_cases():
+        yield case
+
+
+def measure(function, min_time, repeat):
+    """Return the best time per call of `function`, in microseconds.
+
+    :param min_time: minimum duration of a single timing run, in seconds
+    :param repeat: number of timing runs
+    """
+    # find a number of calls lasting at least `min_time`.
+    number = 1
+    while True:
+        start = timer()
+        for _ in range(number):
+            function()
+        elapsed = timer() - start
+        if elapsed >= min_time:
+            break
+        number = number * 2
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = timer()
+        for _ in range(number):
+            function()
+        best = min(best, timer() - start)
+    return best / number * 1e6
+
+
+def run_cases(cases, min_time, repeat):
+    results = {}
+    for case in cases:
+        results[case.name] = dict(
+            (phase, measure(function, min_time, repeat))
+            for phase, function in case.phases()
+        )
+        line = '{0:<32}'.format(case.name) + ''.join(
+            '{0:>12}: {1:>10.2f}us'.format(phase, results[case.name][phase])
+            for phase, _ in case.phases()
+        )
+        if isinstance(case, BatchCase):
+            throughput = (
+                len(case.argv_list) / results[case.name]['parse_many'] * 1e6
+            )
+            line += '  ({0:.0f} argv/s)'.format(throughput)
+        print(line)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare `results` against `baseline`.
+
+    :return: list of ``(case_name, phase, ratio)`` regressed more than
+        `tolerance`
+    """
+    regressions = []
+    for name in sorted(results):
+        for phase, value in sorted(results[name].items()):
+            base_value = baseline.get(name, {}).get(phase)
+            if not base_value:
+                continue
+            ratio = value / base_value
+            if ratio > 1 + tolerance:
+                regressions.append((name, phase, ratio))
+    return regressions
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--filter', default='',
+                            help='run cases whose names contain FILTER.')
+    arg_parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                            help='path of JSON results.')
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help='path of JSON baseline.')
+    arg_parser.add_argument('--save-baseline', action='store_true',
+                            help='save results as the new baseline.')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed slowdown ratio (default: 0.25).')
+    arg_parser.add_argument('--min-time', type=float, default=0.05,
+                            help='minimum duration of a timing run.')
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help='number of timing runs.')
+    options = arg_parser.parse_args(args)
+
+    cases = [case for case in all_cases() if options.filter in case.name]
+    results = run_cases(cases, options.min_time, options.repeat)
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    if options.save_baseline:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baseline saved to {0}.'.format(options.baseline))
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print('No baseline found, run with --save-baseline to create one.')
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.tolerance)
+    for name, phase, ratio in regressions:
+        print('Regression: {0} {1} is {2:.2f}x slower than baseline.'.format(
+            name, phase, ratio,
+        ))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""asyncio interface of parsers
+
+Wrap a :class:`clidoc.codegen.Parser` (or the parser of a generated
+module) for use in coroutines. Requires Python 3.6 or later.
+"""
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import asyncio
+import collections
+
+
+__all__ = [
+    'AsyncParser',
+]
+
+
+# Cheap parses, i.e. `argv` with at most `inline_max_arguments` arguments,
+# are done inline in the event loop. Others, and batches of
+# `parse_many_async`, run in `executor` (the default executor of the loop
+# if None), with at most `max_concurrency` jobs in flight.
+#
+# Results are those of `Parser.parse_result`: the outcome, or a
+# `ParseFailure` if `argv` is rejected. The doc is never printed and the
+# process never exits.
+class AsyncParser(object):
+
+    def __init__(self, parser, flags=0, executor=None, max_concurrency=8,
+                 inline_max_arguments=16, batch_size=64):
+        self._parser = parser
+        self._flags = flags
+        self._executor = executor
+        # created in the event loop on demand.
+        self._semaphore = None
+        self._max_concurrency = max_concurrency
+        self._inline_max_arguments = inline_max_arguments
+        self._batch_size = batch_size
+
+    # cancellation stops waiting for `function`, which is not interrupted
+    # if it is already running.
+    async def _run_in_executor(self, function, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self._executor, function, *args
+            )
+
+    def _parse_batch(self, argv_batch):
+        return list(self._parser.parse_many(argv_batch, self._flags))
+
+    async def parse(self, argv):
+        if len(argv) - 1 <= self._inline_max_arguments:
+            return self._parser.parse_result(argv, self._flags)
+        return await self._run_in_executor(
+            self._parser.parse_result, argv, self._flags,
+        )
+
+    # async generator of results of argv from `argv_iterable`, which is an
+    # async or plain iterable, in order. argv are grouped in batches of
+    # `batch_size`, and pending batches are cancelled if the generator is
+    # closed or cancelled.
+    async def parse_many_async(self, argv_iterable):
+        pending = collections.deque()
+        base_index = 0
+        try:
+            async for argv_batch in self._batches(argv_iterable):
+                pending.append((
+                    base_index,
+                    asyncio.ensure_future(
+                        self._run_in_executor(self._parse_batch, argv_batch),
+                    ),
+                ))
+                base_index += len(argv_batch)
+                # bound the number of batches read ahead.
+                while len(pending) >= self._max_concurrency:
+                    for result in await self._pop_batch(pending):
+                        yield result
+            while pending:
+                for result in await self._pop_batch(pending):
+                    yield result
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    async def _pop_batch(self, pending):
+        base_index, future = pending[0]
+        results = await future
+        pending.popleft()
+        # index of failures in `parse_many_async`.
+        for result in results:
+            if not isinstance(result, dict):
+                result.index += base_index
+        return results
+
+    async def _batches(self, argv_iterable):
+        argv_batch = []
+        if hasattr(argv_iterable, '__aiter__'):
+            async for argv in argv_iterable:
+                argv_batch.append(argv)
+                if len(argv_batch) == self._batch_size:
+                    yield argv_batch
+                    argv_batch = []
+        else:
+            for argv in argv_iterable:
+                argv_batch.append(argv)
+                if len(argv_batch) == self._batch_size:
+                    yield argv_batch
+                    argv_batch = []
+        if argv_batch:
+            yield argv_batch
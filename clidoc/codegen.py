@@ -2,60 +2,87 @@
 from __future__ import (division, absolute_import, print_function,
                         unicode_literals)
 
-from collections import defaultdict
-from copy import deepcopy
+from collections import defaultdict, deque, namedtuple, OrderedDict
+import hashlib
+import itertools
+import json
+import marshal
+import os
 import re
+import string
 import sys
+import threading
+import time
 
 
 __all__ = [
     'SYSTEM_EXIT_OFF',
     'PRINT_DOC_OFF',
     'GUIDELINE_8_OFF',
+    'PARSE_CACHE_ON',
+    'PARSE_STATS_ON',
     'clidoc',
+    'clidoc_cache_info',
+    'clidoc_stats',
+    'Parser',
+    'InstrumentedParser',
+    'ParseCache',
+    'ParseFailure',
+    'ParseStats',
+    'ParseTrace',
+    'TracingParser',
+    'PrefixMatcher',
+    'PrefixState',
 ]
 
 
 SYSTEM_EXIT_OFF = 1 << 0
 PRINT_DOC_OFF = 1 << 1
 GUIDELINE_8_OFF = 1 << 2
-
-
-def clidoc(argv, flags=0):
-    # flags.
-    system_exit_off = SYSTEM_EXIT_OFF & flags
-    print_doc_off = PRINT_DOC_OFF & flags
-    guideline_8_off = GUIDELINE_8_OFF & flags
-
-    def respond_to_error():
-        if not print_doc_off:
-            print(Info.doc_text)
-        if not system_exit_off:
-            sys.exit(0)
-        return False
-
-    # preprocess input argument.
-    argv_prepprocessor = ArgvPreprocessor(
-        argv,
-        Info.option_to_representative_option,
-        Info.bound_options | Info.oom_bound_options,
-    )
-    argv_prepprocessor.tokenize_argv()
-    if not argv_prepprocessor.tokens:
-        return respond_to_error()
-
-    # init match state.
-    Info.load_tokens(argv_prepprocessor.tokens)
-    MatchStateManager.init(MatchState(Info))
-    # token match.
-    all_match = Info.doc_node.match() and MatchStateManager.all_match()
-    if all_match:
-        outcome = MatchStateManager.get_outcome()
-        if not guideline_8_off:
-            split_comma_separated_oom_outcome(outcome)
-        return outcome
-    else:
-        return respond_to_error()
+PARSE_CACHE_ON = 1 << 3
+PARSE_STATS_ON = 1 << 4
+
+
+# return `(clidoc, clidoc_cache_info, clidoc_stats)` of `info`. the parser
+# shared by all `clidoc` calls is built on the first call, and rebuilt if
+# `info.doc_node` is changed.
+def bind_clidoc(info):
+    # `(parser, cache of parser)`, used by calls with `PARSE_CACHE_ON`.
+    state = [None]
+    # `InstrumentedParser`, used by calls with `PARSE_STATS_ON`.
+    instrumented_state = [None]
+
+    def clidoc(argv, flags=0):
+        if PARSE_STATS_ON & flags:
+            # not cached, every call is counted.
+            parser = instrumented_state[0]
+            if parser is None or parser.doc_node is not info.doc_node:
+                parser = instrumented_state[0] = InstrumentedParser(info)
+            return parser.parse(argv, flags)
+        bound = state[0]
+        if bound is None or bound[0].doc_node is not info.doc_node:
+            parser = Parser(info)
+            bound = state[0] = (parser, ParseCache(parser))
+        parser, parse_cache = bound
+        if PARSE_CACHE_ON & flags:
+            return parse_cache.parse(argv, flags)
+        return parser.parse(argv, flags)
+
+    # statistics of the cache used by `clidoc`, or None before the first
+    # call.
+    def clidoc_cache_info():
+        if state[0] is None:
+            return None
+        return state[0][1].cache_info()
+
+    # counters of calls with `PARSE_STATS_ON`, see
+    # `InstrumentedParser.get_stats`. None before the first of them.
+    def clidoc_stats():
+        if instrumented_state[0] is None:
+            return None
+        return instrumented_state[0].get_stats()
+
+    return clidoc, clidoc_cache_info, clidoc_stats
 
 
 def split_comma_separated_oom_outcome(outcome):
@@ -70,7 +97,16 @@ def split_comma_separated_oom_outcome(outcome):
         )
 
 
+# copy lists of `outcome`, other values are immutable.
+def copy_outcome(outcome):
+    return dict(
+        (key, list(value) if isinstance(value, list) else value)
+        for key, value in outcome.items()
+    )
+
+
 # represent outcome of input argument preprocessing.
+# tokens are immutable, since the hash value is cached.
 class Token(object):
     #
     # input argument types:
@@ -91,23 +127,40 @@ class Token(object):
     COMMAND = 3
     ARGUMENT = 4
 
+    __slots__ = ('type_id', 'value', '_hash')
+
+    # `dict` contains mapping from `Token` to its interned instance.
+    _interned_tokens = {}
+
     def __init__(self, type_id, value):
         self.type_id = type_id
         self.value = value
+        self._hash = hash(type_id) ^ hash(value)
+
+    # return the singleton equals to `token`. Grammar tokens are interned,
+    # so that they could be compared by identity.
+    @classmethod
+    def intern(cls, token):
+        return cls._interned_tokens.setdefault(token, token)
 
     def __eq__(self, other):
-        return (self.type_id == other.type_id
-                and self.value == other.value)
+        return self is other or (self.type_id == other.type_id
+                                 and self.value == other.value)
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
         # for dict and set.
-        return hash(self.type_id) ^ hash(self.value)
+        return self._hash
 
     def __repr__(self):
         return '<Token ({0}, {1})>'.format(self.type_id, self.value)
 
 
 # store attributes generated by `clidoc` front end.
+# `Parser` takes a snapshot of these attributes, hence the class itself
+# holds no state of parsing.
 class Info(object):
     # root of AST.
     doc_node = None
@@ -124,114 +177,528 @@ class Info(object):
     default_values = None
     # `dict` contains mapping from `Token` to `Token`.
     option_to_representative_option = None
+    # lookup tables of the preprocessor, keyed by raw strings. derived
+    # from the tables above if not generated.
+    # `dict` contains mapping from raw string to representative option.
+    posix_option_map = None
+    gnu_option_map = None
+    # `dict` contains mapping from raw string to command.
+    command_map = None
+    # `set` of raw strings of bound (and oom bound) options.
+    bound_option_values = None
     # string of user defined doc.
     doc_text = None
 
-    # shared by all match state object.
-    _tokens = None
-    _token_skip_table = None
 
-    @classmethod
-    def load_tokens(cls, tokens):
-        cls._tokens = tokens
-        # construct `_token_skip_table`
-        cls._token_skip_table = defaultdict(list)
-        for index, token in enumerate(tokens):
-            cls._token_skip_table[token].append(index)
+clidoc, clidoc_cache_info, clidoc_stats = bind_clidoc(Info)
 
-    @classmethod
-    def get_tokens(cls):
-        return cls._tokens
 
-    @classmethod
-    def get_token(cls, index):
-        if index < len(cls._tokens):
-            return cls._tokens[index]
-        return None
+# reentrant parser owning the grammar tables of a doc.
+# `parse` keeps all state of a call in its own `MatchStateManager`, so a
+# parser could be shared by threads without lock.
+class Parser(object):
+    # outcome kinds of keys.
+    BOOLEAN_OUTCOME = 0
+    STRING_OUTCOME = 1
+    STRING_LIST_OUTCOME = 2
 
-    @classmethod
-    def search_match_token_indices(cls, key):
-        return cls._token_skip_table.get(key, [])
-
-    @classmethod
-    def is_boolean_key(cls, key):
-        return key in cls.unbound_options or key in cls.commands
+    # `parse_many` resets one manager for all argv if True. derived class
+    # keeping per parse state in managers should set it to False.
+    reuse_buffers = True
 
-    @classmethod
-    def is_string_key(cls, key):
-        return key in cls.bound_options or key in cls.arguments
+    def __init__(self, info):
+        self.doc_node = info.doc_node
 
-    @classmethod
-    def is_string_list_key(cls, key):
-        return key in cls.oom_bound_options or key in cls.oom_arguments
+        # tokens of grammar tables are interned.
+        intern = Token.intern
+        self.bound_options = frozenset(map(intern, info.bound_options))
+        self.unbound_options = frozenset(map(intern, info.unbound_options))
+        self.arguments = frozenset(map(intern, info.arguments))
+        self.oom_bound_options = frozenset(
+            map(intern, info.oom_bound_options),
+        )
+        self.oom_arguments = frozenset(map(intern, info.oom_arguments))
+        self.commands = frozenset(map(intern, info.commands))
 
+        self.default_values = dict(
+            (intern(key), value)
+            for key, value in (info.default_values or {}).items()
+        )
+        self.option_to_representative_option = dict(
+            (intern(option), intern(rep_option))
+            for option, rep_option in (
+                info.option_to_representative_option or {}
+            ).items()
+        )
+        self.doc_text = info.doc_text
+        self._load_lookup_tables(info)
 
-# manage match state of input arguments.
-class MatchState(object):
+        # initial outcome of a parse, copied by `MatchState`.
+        self.initial_boolean_outcome = dict.fromkeys(
+            self.unbound_options | self.commands, False,
+        )
+        self.initial_string_outcome = dict(
+            (key, self.default_values.get(key, ""))
+            for key in self.bound_options | self.arguments
+        )
+        self.string_list_keys = tuple(
+            self.oom_bound_options | self.oom_arguments
+        )
+        self._preprocessor_bound_options = (
+            self.bound_options | self.oom_bound_options
+        )
 
-    def _add_outcome(self, attr_name, tokens, callback):
-        for token in tokens:
-            getattr(self, attr_name)[token] = callback(token)
+        # finalize, analyze and compile AST to pre-bound closures.
+        self._match_doc = None
+        if self.doc_node is not None:
+            self.doc_node.finalize(self)
+            self.doc_node.analyze()
+            self.doc_node.analyze_follow(frozenset())
+            self._match_doc = self.compile_node(self.doc_node)
+        self._prefix_matcher = PrefixMatcher(self)
+
+    def _load_lookup_tables(self, info):
+        if (info.posix_option_map is None
+                or info.gnu_option_map is None
+                or info.command_map is None
+                or info.bound_option_values is None):
+            lookup_tables = ArgvPreprocessor.build_lookup_tables(
+                self.option_to_representative_option,
+                self.bound_options | self.oom_bound_options,
+                self.commands,
+            )
+        else:
+            intern = Token.intern
+            lookup_tables = (
+                dict((value, intern(option))
+                     for value, option in info.posix_option_map.items()),
+                dict((value, intern(option))
+                     for value, option in info.gnu_option_map.items()),
+                dict((value, intern(command))
+                     for value, command in info.command_map.items()),
+                frozenset(info.bound_option_values),
+            )
+        (self.posix_option_map, self.gnu_option_map,
+         self.command_map, self.bound_option_values) = lookup_tables
+        self._lookup_tables = lookup_tables
+
+    def is_boolean_key(self, key):
+        return key in self.unbound_options or key in self.commands
+
+    def is_string_key(self, key):
+        return key in self.bound_options or key in self.arguments
+
+    def is_string_list_key(self, key):
+        return key in self.oom_bound_options or key in self.oom_arguments
+
+    # return outcome kind of `key`, or None if `key` has no outcome.
+    def get_outcome_kind(self, key):
+        if self.is_boolean_key(key):
+            return self.BOOLEAN_OUTCOME
+        if self.is_string_key(key):
+            return self.STRING_OUTCOME
+        if self.is_string_list_key(key):
+            return self.STRING_LIST_OUTCOME
+        return None
 
-    def _add_boolean_outcome(self, tokens):
-        self._add_outcome(
-            '_boolean_outcome',
-            tokens,
-            lambda x: False,
+    def create_preprocessor(self, argv):
+        return ArgvPreprocessor(
+            argv,
+            self.option_to_representative_option,
+            self._preprocessor_bound_options,
+            self.commands,
+            self.oom_bound_options,
+            self._lookup_tables,
         )
 
-    def _add_string_outcome(self, tokens, default_values):
-        self._add_outcome(
-            '_string_outcome',
-            tokens,
-            lambda token: default_values.get(token, ""),
+    # preprocess `argv`, return a list of tokens.
+    def tokenize(self, argv):
+        argv_prepprocessor = self.create_preprocessor(argv)
+        argv_prepprocessor.tokenize_argv()
+        return argv_prepprocessor.tokens
+
+    # return the compiled closure of `node`. nodes compile their children
+    # through this method, which derived class could override to wrap
+    # closures.
+    def compile_node(self, node):
+        return node.compile(self)
+
+    def create_manager(self, tokens):
+        return MatchStateManager(self, tokens)
+
+    # match AST against tokens loaded by `manager`.
+    def match(self, manager):
+        return self._match_doc(manager)
+
+    # return outcome of `argv`, or a `ParseFailure` if `argv` is rejected.
+    # only `GUIDELINE_8_OFF` of `flags` is respected.
+    def parse_result(self, argv, flags=0):
+        # preprocess input argument.
+        tokens = self.tokenize(argv)
+        if not tokens:
+            return ParseFailure(argv, ParseFailure.NO_ARGUMENT)
+
+        # init match state of this call.
+        return self._match_tokens(argv, self.create_manager(tokens), flags)
+
+    # match tokens of `argv` loaded by `manager`, return as
+    # `parse_result`.
+    def _match_tokens(self, argv, manager, flags):
+        all_match = self.match(manager) and manager.all_match()
+        if not all_match:
+            return ParseFailure(argv, ParseFailure.MISMATCH)
+        outcome = manager.get_outcome()
+        if not GUIDELINE_8_OFF & flags:
+            split_comma_separated_oom_outcome(outcome)
+        return outcome
+
+    # return outcome of `argv`, or None if `argv` is rejected. only
+    # `GUIDELINE_8_OFF` of `flags` is respected.
+    def parse_outcome(self, argv, flags=0):
+        outcome = self.parse_result(argv, flags)
+        if isinstance(outcome, ParseFailure):
+            return None
+        return outcome
+
+    # generator of outcomes of `argv_iterable`, in order. rejected `argv`
+    # yields a `ParseFailure` instead of printing doc or exiting, only
+    # `GUIDELINE_8_OFF` of `flags` is respected.
+    # if `reuse_buffers` is True, one manager is reset for each `argv`
+    # instead of creating a new one.
+    def parse_many(self, argv_iterable, flags=0):
+        if not self.reuse_buffers:
+            for outcome in self._parse_each(argv_iterable, flags):
+                yield outcome
+            return
+
+        tokenize = self.tokenize
+        match_tokens = self._match_tokens
+        manager = None
+        for index, argv in enumerate(argv_iterable):
+            tokens = tokenize(argv)
+            if not tokens:
+                outcome = ParseFailure(argv, ParseFailure.NO_ARGUMENT)
+            else:
+                if manager is None:
+                    manager = self.create_manager(tokens)
+                else:
+                    manager.reset(tokens)
+                outcome = match_tokens(argv, manager, flags)
+            if isinstance(outcome, ParseFailure):
+                outcome.index = index
+            yield outcome
+
+    def _parse_each(self, argv_iterable, flags):
+        parse_result = self.parse_result
+        for index, argv in enumerate(argv_iterable):
+            outcome = parse_result(argv, flags)
+            if isinstance(outcome, ParseFailure):
+                outcome.index = index
+            yield outcome
+
+    # parallel version of `parse_many`, `argv_iterable` is parsed by a
+    # pool of `workers` processes (default to the number of CPUs), which
+    # load the grammar once per process. `chunksize` argv are sent to a
+    # worker at a time. if `ordered` is False, yield `(index, outcome)`
+    # as soon as a outcome is ready.
+    # at most `PARALLEL_PENDING_CHUNKS * workers` chunks are sent and not
+    # yielded yet, so that `argv_iterable` is read as outcomes are
+    # consumed.
+    def parse_parallel(self, argv_iterable, workers=None, chunksize=64,
+                       flags=0, ordered=True):
+        import multiprocessing
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(
+            workers,
+            initializer=_init_parallel_worker,
+            initargs=(dump_grammar(self), self.doc_text, flags),
         )
+        max_pending = PARALLEL_PENDING_CHUNKS * workers
+        indexed_argv = enumerate(argv_iterable)
+        pending = deque()
+        completed = False
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    chunk = list(itertools.islice(indexed_argv, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(pool.apply_async(
+                        _parse_in_parallel_worker, (chunk,),
+                    ))
+                if not pending:
+                    break
+                results = _pop_parallel_chunk(pending, ordered).get()
+                for index, outcome in results:
+                    yield outcome if ordered else (index, outcome)
+            completed = True
+        finally:
+            if completed:
+                pool.close()
+            else:
+                # the generator is closed or failed, stop workers.
+                pool.terminate()
+            pool.join()
+
+    # return the `PrefixState` of `argv`, which might be incomplete. see
+    # `PrefixMatcher`.
+    def match_prefix(self, argv):
+        return self._prefix_matcher.match(argv)
+
+    def respond_to_error(self, flags=0):
+        if not PRINT_DOC_OFF & flags:
+            print(self.doc_text)
+        if not SYSTEM_EXIT_OFF & flags:
+            sys.exit(0)
+        return False
 
-    def _add_string_list_outcome(self, tokens):
-        self._add_outcome(
-            '_string_list_outcome',
-            tokens,
-            lambda x: [],
+    def parse(self, argv, flags=0):
+        outcome = self.parse_outcome(argv, flags)
+        if outcome is None:
+            return self.respond_to_error(flags)
+        return outcome
+
+
+# chunks sent per worker process of `Parser.parse_parallel`.
+PARALLEL_PENDING_CHUNKS = 2
+# seconds waited before checking pending chunks again, if outcomes are
+# not ordered.
+PARALLEL_POLL_INTERVAL = 0.01
+
+# `(parser, flags)` of a worker process of `Parser.parse_parallel`.
+_parallel_worker_state = None
+
+
+def _init_parallel_worker(data, doc_text, flags):
+    global _parallel_worker_state
+
+    class WorkerInfo(Info):
+        pass
+    WorkerInfo.doc_text = doc_text
+    load_grammar(WorkerInfo, data)
+    _parallel_worker_state = (Parser(WorkerInfo), flags)
+
+
+# return `(index, outcome)` pairs of a chunk of `(index, argv)` pairs.
+def _parse_in_parallel_worker(chunk):
+    parser, flags = _parallel_worker_state
+    results = []
+    for index, argv in chunk:
+        outcome = parser.parse_result(argv, flags)
+        if isinstance(outcome, ParseFailure):
+            outcome.index = index
+        results.append((index, outcome))
+    return results
+
+
+# remove and return a `AsyncResult` of `pending` chunks, the first one if
+# `ordered`, otherwise the first one ready.
+def _pop_parallel_chunk(pending, ordered):
+    if ordered:
+        return pending.popleft()
+    while True:
+        for position, result in enumerate(pending):
+            if result.ready():
+                del pending[position]
+                return result
+        pending[0].wait(PARALLEL_POLL_INTERVAL)
+
+
+# rejection of `argv`, which is false in boolean context.
+# `index` is the position of `argv` in the input of `Parser.parse_many`.
+class ParseFailure(object):
+    # reasons.
+    NO_ARGUMENT = 'no_argument'
+    MISMATCH = 'mismatch'
+
+    def __init__(self, argv, reason, index=None):
+        self.argv = argv
+        self.reason = reason
+        self.index = index
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<ParseFailure ({0}, {1}, {2})>'.format(
+            self.index, self.reason, self.argv,
         )
 
-    def __init__(self, InfoCls):
-        self._consumed_flags = [False] * len(InfoCls.get_tokens())
 
-        self._boolean_outcome = {}
-        self._add_boolean_outcome(InfoCls.unbound_options)
-        self._add_boolean_outcome(InfoCls.commands)
+# bounded LRU cache of `parser.parse`, keyed by `argv[1:]` and the flags
+# affecting outcome. rejected `argv` is cached as well. callers get
+# copies of cached outcomes.
+class ParseCache(object):
 
-        self._string_outcome = {}
-        self._add_string_outcome(InfoCls.bound_options, InfoCls.default_values)
-        self._add_string_outcome(InfoCls.arguments, InfoCls.default_values)
+    CacheInfo = namedtuple(
+        'CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'],
+    )
 
-        self._string_list_outcome = {}
-        self._add_string_list_outcome(InfoCls.oom_bound_options)
-        self._add_string_list_outcome(InfoCls.oom_arguments)
+    def __init__(self, parser, maxsize=128):
+        self._parser = parser
+        self._maxsize = maxsize
+        self._outcomes = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            if key not in self._outcomes:
+                self._misses += 1
+                return False, None
+            # move to the most recently used end.
+            outcome = self._outcomes.pop(key)
+            self._outcomes[key] = outcome
+            self._hits += 1
+            return True, outcome
+
+    def _store(self, key, outcome):
+        with self._lock:
+            self._outcomes[key] = outcome
+            while len(self._outcomes) > self._maxsize:
+                self._outcomes.popitem(last=False)
+
+    def parse(self, argv, flags=0):
+        key = (tuple(argv[1:]), GUIDELINE_8_OFF & flags)
+        found, outcome = self._lookup(key)
+        if not found:
+            # parse without lock, `parser` is reentrant.
+            outcome = self._parser.parse_outcome(argv, flags)
+            self._store(key, outcome)
+        if outcome is None:
+            return self._parser.respond_to_error(flags)
+        return copy_outcome(outcome)
+
+    def cache_info(self):
+        with self._lock:
+            return self.CacheInfo(
+                self._hits, self._misses,
+                self._maxsize, len(self._outcomes),
+            )
+
+    def cache_clear(self):
+        with self._lock:
+            self._outcomes.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+# manage match state of input arguments.
+class MatchState(object):
+
+    def __init__(self, grammar, num_tokens):
+        self._consumed_flags = [False] * num_tokens
+        # "next pointers" of union-find, with `num_tokens` as sentinel.
+        # `_next_unconsumed[index] == index` if `index` is not consumed,
+        # otherwise it points to a greater index, and all indices skipped
+        # are consumed.
+        self._next_unconsumed = list(range(num_tokens + 1))
+
+        # copy initial outcome prepared by `grammar`.
+        self._boolean_outcome = dict(grammar.initial_boolean_outcome)
+        self._string_outcome = dict(grammar.initial_string_outcome)
+        self._string_list_outcome = dict(
+            (key, []) for key in grammar.string_list_keys
+        )
+
+        self._string_list_keys = grammar.string_list_keys
+
+        # undo log of mutations, used for backtracking.
+        # * `(container, key, old_value)`: restore `container[key]`.
+        # * `(values, length)`: truncate list `values` to `length`.
+        # * `(values,)`: pop the last element of list `values`.
+        self._trail = []
+
+    # restore the initial state for `num_tokens` tokens. mutations of the
+    # last parse are reverted through the trail, except lists of string
+    # list outcome, which might be returned by `get_outcome` and are
+    # replaced instead.
+    def reset(self, num_tokens):
+        trail = self._trail
+        for entry in reversed(trail):
+            if len(entry) == 3:
+                container, key, old_value = entry
+                container[key] = old_value
+        del trail[:]
+        if num_tokens != len(self._consumed_flags):
+            self._consumed_flags = [False] * num_tokens
+            self._next_unconsumed = list(range(num_tokens + 1))
+        string_list_outcome = self._string_list_outcome
+        for key in self._string_list_keys:
+            string_list_outcome[key] = []
+
+    def _set_and_record(self, container, key, value):
+        self._trail.append((container, key, container[key]))
+        container[key] = value
 
     def add_boolean_outcome(self, key):
-        self._boolean_outcome[key] = True
+        self._set_and_record(self._boolean_outcome, key, True)
 
     def add_string_outcome(self, key, value):
-        self._string_outcome[key] = value
+        self._set_and_record(self._string_outcome, key, value)
 
     def add_string_list_outcome(self, key, value):
-        self._string_list_outcome[key].append(value)
+        values = self._string_list_outcome[key]
+        self._trail.append((values,))
+        values.append(value)
+
+    def extend_string_list_outcome(self, key, new_values):
+        values = self._string_list_outcome[key]
+        self._trail.append((values, len(values)))
+        values.extend(new_values)
 
     def set_consumed_flag(self, index):
-        self._consumed_flags[index] = True
+        if not self._consumed_flags[index]:
+            self._set_and_record(self._consumed_flags, index, True)
+            self._set_and_record(self._next_unconsumed, index, index + 1)
+
+    # return a mark of current state, which is O(1).
+    def mark(self):
+        return len(self._trail)
+
+    # undo all mutations made after `mark`.
+    def undo(self, mark):
+        trail = self._trail
+        while len(trail) > mark:
+            entry = trail.pop()
+            if len(entry) == 1:
+                entry[0].pop()
+            elif len(entry) == 2:
+                del entry[0][entry[1]:]
+            else:
+                container, key, old_value = entry
+                container[key] = old_value
 
     def get_consumed_flag(self, index):
         return self._consumed_flags[index]
 
+    # find with path halving. Writes of path compression are recorded as
+    # well, so that rollback restores exact pointers.
+    def _find_unconsumed(self, index):
+        next_unconsumed = self._next_unconsumed
+        trail = self._trail
+        while next_unconsumed[index] != index:
+            parent = next_unconsumed[index]
+            grandparent = next_unconsumed[parent]
+            if grandparent != parent:
+                trail.append((next_unconsumed, index, parent))
+                next_unconsumed[index] = grandparent
+            index = grandparent
+        return index
+
     def get_first_unconsumed_index(self, start=0):
-        for offset, flag in enumerate(self._consumed_flags[start:]):
-            if not flag:
-                return start + offset
-        return None
+        index = self._find_unconsumed(start)
+        if index == len(self._consumed_flags):
+            return None
+        return index
 
     def all_match(self):
-        return all(self._consumed_flags)
+        return self._find_unconsumed(0) == len(self._consumed_flags)
 
     def get_outcome(self):
         outcome = {}
@@ -241,138 +708,559 @@ class MatchState(object):
         return outcome
 
 
+# match context of a single parse.
+# `grammar` is the `Parser` providing grammar tables.
 class MatchStateManager(object):
+    # derived class could override it.
+    match_state_class = MatchState
 
-    @classmethod
-    def init(cls, match_state):
-        cls._match_state = match_state
-        cls._state_stack = []
+    def __init__(self, grammar, tokens):
+        self._grammar = grammar
+        self._tokens = tokens
+        # construct `_token_skip_table`
+        self._token_skip_table = defaultdict(list)
+        for index, token in enumerate(tokens):
+            self._token_skip_table[token].append(index)
+
+        self._match_state = self.match_state_class(grammar, len(tokens))
+        self._state_stack = []
+        # children selected by each `LogicXor`, see `_compile_dispatch`.
+        self.dispatch_cache = {}
+
+    # load `tokens` for a new parse, reusing buffers of this manager.
+    def reset(self, tokens):
+        self._tokens = tokens
+        skip_table = self._token_skip_table
+        skip_table.clear()
+        for index, token in enumerate(tokens):
+            skip_table[token].append(index)
 
-    @classmethod
-    def all_match(cls):
-        return cls._match_state.all_match()
+        self._match_state.reset(len(tokens))
+        del self._state_stack[:]
+        self.dispatch_cache.clear()
 
-    @classmethod
-    def get_outcome(cls):
+    def get_tokens(self):
+        return self._tokens
+
+    def get_token(self, index):
+        if index < len(self._tokens):
+            return self._tokens[index]
+        return None
+
+    def search_match_token_indices(self, key):
+        return self._token_skip_table.get(key, [])
+
+    # return distinct tokens of input arguments.
+    def get_token_keys(self):
+        return self._token_skip_table.keys()
+
+    def get_num_token_keys(self):
+        return len(self._token_skip_table)
+
+    # `required`: a list of `(key, count)` pairs.
+    # return True if every `key` occurs at least `count` times in input
+    # arguments.
+    def contains_all(self, required):
+        skip_table = self._token_skip_table
+        for key, count in required:
+            indices = skip_table.get(key)
+            if indices is None or len(indices) < count:
+                return False
+        return True
+
+    # return True if any of `keys` occurs in input arguments.
+    def contains_any(self, keys):
+        skip_table = self._token_skip_table
+        if len(keys) <= len(skip_table):
+            for key in keys:
+                if key in skip_table:
+                    return True
+        else:
+            for key in skip_table:
+                if key in keys:
+                    return True
+        return False
+
+    def all_match(self):
+        return self._match_state.all_match()
+
+    def get_outcome(self):
         outcome = {}
-        for token_key, value in cls._match_state.get_outcome().items():
+        for token_key, value in self._match_state.get_outcome().items():
             outcome[token_key.value] = value
         return outcome
 
-    @classmethod
-    def push_rollback_point(cls):
-        cls._state_stack.append(deepcopy(cls._match_state))
+    def push_rollback_point(self):
+        self._state_stack.append(self._match_state.mark())
 
-    @classmethod
-    def pop_rollback_point(cls):
-        return cls._state_stack.pop()
+    def pop_rollback_point(self):
+        return self._state_stack.pop()
 
-    @classmethod
-    def rollback(cls):
-        cls._match_state = cls.pop_rollback_point()
+    def rollback(self):
+        self._match_state.undo(self.pop_rollback_point())
 
-    @classmethod
-    def _prepare_unconsumed_index(cls, key):
-        match_indices = Info.search_match_token_indices(key)
+    def _prepare_unconsumed_index(self, key, is_string_list):
+        match_indices = self.search_match_token_indices(key)
         for index in match_indices:
-            if not cls._match_state.get_consumed_flag(index):
+            if not self._match_state.get_consumed_flag(index):
                 return index
 
         # state: cannot find a unconsumed match token.
-        if Info.is_string_list_key(key) and match_indices:
+        if is_string_list and match_indices:
             # pretend the last matched token is not consumed.
             return match_indices[-1]
 
         return None
 
-    @classmethod
-    def try_to_generate_boolean_outcome(cls, key):
-        if not Info.is_boolean_key(key):
-            return False
+    # consume `key` and its value, return index of the value token.
+    # return None if failed.
+    def _consume_key_and_value(self, key, is_string_list):
+        match_state = self._match_state
 
-        index = cls._prepare_unconsumed_index(key)
+        if key.type_id == Token.ARGUMENT:
+            # deal with `ARGUMENT`.
+            index = match_state.get_first_unconsumed_index()
+            if index is None:
+                return None
+            # 1. GENERAL_ELEMENT or COMMAND.
+            # 2. not consumed.
+            type_id = self._tokens[index].type_id
+            if (type_id != Token.GENERAL_ELEMENT
+                    and type_id != Token.COMMAND):
+                return None
+            match_state.set_consumed_flag(index)
+            return index
+
+        # deal with other nodes.
+        key_index = self._prepare_unconsumed_index(key, is_string_list)
+        if key_index is None:
+            return None
+        # search the first unconsumed token begins with `key_index` + 1.
+        index = match_state.get_first_unconsumed_index(key_index + 1)
+        if index is None:
+            return None
+        # 1. GENERAL_ELEMENT.
+        # 2. not consumed.
+        if self._tokens[index].type_id != Token.GENERAL_ELEMENT:
+            return None
+        match_state.set_consumed_flag(key_index)
+        match_state.set_consumed_flag(index)
+        return index
+
+    # `generate_*_outcome` assume `key` is of the corresponding outcome
+    # kind, which is resolved by `Terminal.finalize`.
+    def generate_boolean_outcome(self, key):
+        index = self._prepare_unconsumed_index(key, False)
         if index is None:
             return False
         # change match state.
-        cls._match_state.add_boolean_outcome(key)
-        cls._match_state.set_consumed_flag(index)
+        self._match_state.add_boolean_outcome(key)
+        self._match_state.set_consumed_flag(index)
         return True
 
-    @classmethod
-    def _try_to_generate_outcome_with_value(cls, key, store_key_value_pair):
+    def generate_string_outcome(self, key):
+        index = self._consume_key_and_value(key, False)
+        if index is None:
+            return False
+        self._match_state.add_string_outcome(key, self._tokens[index].value)
+        return True
 
-        def access_argument_token(index):
-            token = Info.get_token(index)
-            if token is None:
-                return False, None
-            # 1. GENERAL_ELEMENT or COMMAND.
-            # 2. not consumed.
-            flag = ((token.type_id == Token.GENERAL_ELEMENT
-                     or token.type_id == Token.COMMAND)
-                    and not cls._match_state.get_consumed_flag(index))
-            value = token.value
-            return flag, value
-
-        def access_normal_token(index):
-            token = Info.get_token(index)
-            if token is None:
-                return False, None
-            # 1. GENERAL_ELEMENT.
-            # 2. not consumed.
-            flag = (token.type_id == Token.GENERAL_ELEMENT
-                    and not cls._match_state.get_consumed_flag(index))
-            value = token.value
-            return flag, value
+    def generate_string_list_outcome(self, key):
+        index = self._consume_key_and_value(key, True)
+        if index is None:
+            return False
+        self._match_state.add_string_list_outcome(
+            key,
+            self._tokens[index].value,
+        )
+        return True
+
+    # same as calling `generate_string_list_outcome(key)` repeatedly until
+    # it fails, but consumes the whole run in one linear sweep.
+    # return the number of values consumed.
+    def generate_string_list_outcome_run(self, key):
+        match_state = self._match_state
+        tokens = self._tokens
+        values = []
 
         if key.type_id == Token.ARGUMENT:
             # deal with `ARGUMENT`.
-            key_index = cls._match_state.get_first_unconsumed_index()
-            if key_index is None:
-                return False
-            flag, value = access_argument_token(key_index)
-            if flag:
-                cls._match_state.set_consumed_flag(key_index)
-                store_key_value_pair(key, value)
-                return True
+            index = match_state.get_first_unconsumed_index()
+            while index is not None:
+                token = tokens[index]
+                if (token.type_id != Token.GENERAL_ELEMENT
+                        and token.type_id != Token.COMMAND):
+                    break
+                match_state.set_consumed_flag(index)
+                values.append(token.value)
+                # state: all indices before `index` are consumed.
+                index = match_state.get_first_unconsumed_index(index + 1)
         else:
-            # deal with other nodes.
-            key_index = cls._prepare_unconsumed_index(key)
-            if key_index is None:
-                return False
-            # search the first unconsumed token begins with `key_index` + 1.
-            value_index = cls._match_state.get_first_unconsumed_index(
-                key_index + 1,
-            )
-            if value_index is None:
-                return False
-            flag, value = access_normal_token(value_index)
-            if flag:
-                cls._match_state.set_consumed_flag(key_index)
-                cls._match_state.set_consumed_flag(value_index)
-                store_key_value_pair(key, value)
-                return True
-        return False
+            # deal with oom bound option.
+            match_indices = self.search_match_token_indices(key)
+            cursor = 0
+            while match_indices:
+                # state: all indices in `match_indices[:cursor]` are
+                # consumed.
+                while (cursor < len(match_indices)
+                       and match_state.get_consumed_flag(
+                           match_indices[cursor])):
+                    cursor = cursor + 1
+                if cursor < len(match_indices):
+                    key_index = match_indices[cursor]
+                else:
+                    # pretend the last matched token is not consumed.
+                    key_index = match_indices[-1]
+                index = match_state.get_first_unconsumed_index(key_index + 1)
+                if (index is None
+                        or tokens[index].type_id != Token.GENERAL_ELEMENT):
+                    break
+                match_state.set_consumed_flag(key_index)
+                match_state.set_consumed_flag(index)
+                values.append(tokens[index].value)
+
+        if values:
+            match_state.extend_string_list_outcome(key, values)
+        return len(values)
+
+
+# Instrumentation.
+#
+# `InstrumentedParser` compiles every node into a closure counting its
+# calls, and creates managers counting rollbacks, scans of unconsumed
+# tokens and probes of the token skip table. `Parser` is not affected, so
+# that counters cost nothing unless requested.
+
+# counters of one or more parses.
+# * `parses`: number of parses reaching the matcher.
+# * `node_matches`: number of calls of compiled nodes, keyed by class name.
+# * `rollback_points`: calls of `push_rollback_point`.
+# * `rollbacks`: calls of `rollback`.
+# * `unconsumed_scans`: calls of `get_first_unconsumed_index`.
+# * `unconsumed_scan_length`: indices skipped by these calls, i.e. the
+#   cost of linear scans.
+# * `skip_table_probes`: lookups of keys in the token skip table.
+class ParseStats(object):
+
+    COUNTERS = (
+        'parses',
+        'rollback_points',
+        'rollbacks',
+        'unconsumed_scans',
+        'unconsumed_scan_length',
+        'skip_table_probes',
+    )
 
-    @classmethod
-    def try_to_generate_string_outcome(cls, key):
-        if not Info.is_string_key(key):
-            return False
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.node_matches = defaultdict(int)
+
+    def merge(self, other):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for node_kind, count in other.node_matches.items():
+            self.node_matches[node_kind] += count
+
+    def copy(self):
+        stats = ParseStats()
+        stats.merge(self)
+        return stats
+
+    def as_dict(self):
+        stats = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        stats['node_matches'] = dict(self.node_matches)
+        return stats
 
-        return cls._try_to_generate_outcome_with_value(
-            key,
-            cls._match_state.add_string_outcome,
+    def __repr__(self):
+        return '<ParseStats {0}>'.format(self.as_dict())
+
+
+class InstrumentedMatchState(MatchState):
+    # set by `InstrumentedMatchStateManager`.
+    stats = None
+
+    def get_first_unconsumed_index(self, start=0):
+        index = MatchState.get_first_unconsumed_index(self, start)
+        end = len(self._consumed_flags) if index is None else index
+        self.stats.unconsumed_scans += 1
+        self.stats.unconsumed_scan_length += end - start
+        return index
+
+
+# token skip table counting lookups of keys.
+class ProbeCountingTable(dict):
+
+    def __init__(self, table, stats):
+        dict.__init__(self, table)
+        self._stats = stats
+
+    def get(self, key, default=None):
+        self._stats.skip_table_probes += 1
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        self._stats.skip_table_probes += 1
+        return dict.__contains__(self, key)
+
+    # a full scan probes every key.
+    def keys(self):
+        self._stats.skip_table_probes += len(self)
+        return dict.keys(self)
+
+    def __iter__(self):
+        self._stats.skip_table_probes += len(self)
+        return dict.__iter__(self)
+
+
+class InstrumentedMatchStateManager(MatchStateManager):
+    match_state_class = InstrumentedMatchState
+
+    def __init__(self, grammar, tokens, stats):
+        MatchStateManager.__init__(self, grammar, tokens)
+        self.stats = stats
+        self._match_state.stats = stats
+        self._token_skip_table = ProbeCountingTable(
+            self._token_skip_table, stats,
         )
 
-    @classmethod
-    def try_to_generate_string_list_outcome(cls, key):
-        if not Info.is_string_list_key(key):
-            return False
+    def push_rollback_point(self):
+        self.stats.rollback_points += 1
+        MatchStateManager.push_rollback_point(self)
+
+    def rollback(self):
+        self.stats.rollbacks += 1
+        MatchStateManager.rollback(self)
+
+
+# parser collecting `ParseStats` of each parse, and of all parses.
+class InstrumentedParser(Parser):
+
+    StatsInfo = namedtuple('StatsInfo', ['last', 'total'])
+    reuse_buffers = False
+
+    def __init__(self, info):
+        # counters of the parse in progress, per thread.
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._last_stats = ParseStats()
+        self._total_stats = ParseStats()
+        super(InstrumentedParser, self).__init__(info)
+
+    def compile_node(self, node):
+        match_node = node.compile(self)
+        node_kind = type(node).__name__
+
+        def match_counted(manager):
+            manager.stats.node_matches[node_kind] += 1
+            return match_node(manager)
+        return match_counted
+
+    # out of `parse_result`, e.g. phases called one by one, counters go to
+    # fresh `ParseStats` which are not recorded.
+    def create_manager(self, tokens):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = ParseStats()
+        stats.parses += 1
+        return InstrumentedMatchStateManager(self, tokens, stats)
+
+    def parse_result(self, argv, flags=0):
+        stats = self._local.stats = ParseStats()
+        try:
+            return super(InstrumentedParser, self).parse_result(argv, flags)
+        finally:
+            del self._local.stats
+            with self._stats_lock:
+                self._last_stats = stats
+                self._total_stats.merge(stats)
+
+    # return `(last, total)`, copies of counters of the last parse and of
+    # all parses.
+    def get_stats(self):
+        with self._stats_lock:
+            return self.StatsInfo(
+                self._last_stats.copy(), self._total_stats.copy(),
+            )
 
-        return cls._try_to_generate_outcome_with_value(
-            key,
-            cls._match_state.add_string_list_outcome,
+    def clear_stats(self):
+        with self._stats_lock:
+            self._last_stats = ParseStats()
+            self._total_stats = ParseStats()
+
+
+# Tracing.
+#
+# `TracingParser` records a `ParseTrace` of each parse: spans of the parse,
+# of phases of `ArgvPreprocessor` and of calls of compiled nodes, and an
+# instant event for each rollback. Like `InstrumentedParser`, it costs
+# nothing to `Parser`.
+
+if hasattr(time, 'perf_counter'):
+    get_trace_clock = time.perf_counter
+else:
+    get_trace_clock = time.time
+
+
+# events of a parse in Chrome trace-event format, loadable by trace viewers
+# such as chrome://tracing or Perfetto.
+class ParseTrace(object):
+
+    def __init__(self):
+        self.events = []
+        self._pid = os.getpid()
+        self._tid = threading.current_thread().ident
+
+    def _add_event(self, phase, name, category, args):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': phase,
+            # microseconds.
+            'ts': get_trace_clock() * 1e6,
+            'pid': self._pid,
+            'tid': self._tid,
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def begin(self, name, category, args=None):
+        self._add_event('B', name, category, args)
+
+    def end(self, name, category, args=None):
+        self._add_event('E', name, category, args)
+
+    def instant(self, name, category, args=None):
+        self._add_event('i', name, category, args)
+        # scoped to the thread.
+        self.events[-1]['s'] = 't'
+
+    def to_json(self):
+        return json.dumps({
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ns',
+        })
+
+    # write the trace to the file of `path`.
+    def dump(self, path):
+        with open(path, 'wb') as trace_file:
+            trace_file.write(self.to_json().encode('utf-8'))
+
+
+# trace discarding events, used by phases of `TracingParser` called out of
+# `trace_parse`.
+class NullParseTrace(ParseTrace):
+
+    def _add_event(self, phase, name, category, args):
+        pass
+
+    def instant(self, name, category, args=None):
+        pass
+
+
+class TracingMatchStateManager(MatchStateManager):
+
+    def __init__(self, grammar, tokens, trace):
+        MatchStateManager.__init__(self, grammar, tokens)
+        self.trace = trace
+
+    def rollback(self):
+        mark = self._state_stack[-1]
+        self.trace.instant('rollback', 'match', {
+            # number of mutations undone.
+            'undone': self._match_state.mark() - mark,
+        })
+        MatchStateManager.rollback(self)
+
+
+# parser recording a `ParseTrace` of each parse, see `trace_parse`.
+class TracingParser(Parser):
+    reuse_buffers = False
+
+    def __init__(self, info):
+        # trace of the parse in progress, per thread.
+        self._local = threading.local()
+        # trace of the last parse.
+        self.last_trace = None
+        super(TracingParser, self).__init__(info)
+
+    def compile_node(self, node):
+        match_node = node.compile(self)
+        name = type(node).__name__
+        args = None
+        if isinstance(node, Terminal):
+            name = '{0} {1}'.format(name, node.key.value)
+            args = {'value': node.key.value}
+        elif isinstance(node, LazyBranch):
+            args = {'command': node._command}
+
+        def match_traced(manager):
+            trace = manager.trace
+            trace.begin(name, 'match', args)
+            matched = match_node(manager)
+            trace.end(name, 'match', {'matched': bool(matched)})
+            return matched
+        return match_traced
+
+    # return the trace of the parse in progress, or a `NullParseTrace` if
+    # phases are called out of `trace_parse`.
+    def get_current_trace(self):
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            trace = NullParseTrace()
+        return trace
+
+    def tokenize(self, argv):
+        trace = self.get_current_trace()
+        argv_prepprocessor = self.create_preprocessor(argv)
+
+        def run_traced(name, phase):
+            trace.begin(name, 'tokenize')
+            phase()
+            trace.end(name, 'tokenize', {
+                'tokens': len(argv_prepprocessor.tokens),
+            })
+        argv_prepprocessor.tokenize_argv(run_traced)
+        return argv_prepprocessor.tokens
+
+    def create_manager(self, tokens):
+        return TracingMatchStateManager(
+            self, tokens, self.get_current_trace(),
         )
 
+    # return `(result, trace)` of `argv`, where `result` is that of
+    # `parse_result`.
+    def trace_parse(self, argv, flags=0):
+        trace = self._local.trace = ParseTrace()
+        # decode as `ArgvPreprocessor` does, the trace is serialized as
+        # JSON.
+        trace.begin('parse', 'parse', {'argv': [
+            arg.decode('utf-8') if hasattr(arg, 'decode') else arg
+            for arg in argv
+        ]})
+        try:
+            result = super(TracingParser, self).parse_result(argv, flags)
+        finally:
+            del self._local.trace
+        trace.end('parse', 'parse', {
+            'matched': not isinstance(result, ParseFailure),
+        })
+        return result, trace
+
+    def parse_result(self, argv, flags=0):
+        result, self.last_trace = self.trace_parse(argv, flags)
+        return result
+
+
+# return True if `node` matches only if the key of one of its FIRST
+# terminals occurs in input arguments. `ARGUMENT` matches any unconsumed
+# input argument hence is not counted.
+def is_anchored_by_first(node):
+    return not node.nullable and all(
+        key.type_id != Token.ARGUMENT for key in node.first
+    )
+
 
 # Implement classes representing following classes:
 #
@@ -389,73 +1277,122 @@ class MatchStateManager(object):
 #   * LogicOr
 #   * LogicOptional
 #   * LogicOneOrMore
+#
+# Before compiling, `finalize(grammar)` resolves grammar dependent
+# attributes of nodes, i.e. the key and outcome kind of terminals.
+#
+# Then static analysis is applied to the AST. `analyze()` computes
+# following attributes of nodes bottom-up:
+#   * `nullable`: True if the node could match without matching any
+#     terminal.
+#   * `first`: `frozenset` of keys of terminals that could be the first
+#     successfully matched terminal of the node.
+#   * `required`: `dict` contains mapping from key to the number of
+#     terminals of the key that must be matched if the node matches.
+# and `analyze_follow(follow)` computes top-down:
+#   * `follow`: `frozenset` of keys of terminals that could be matched
+#     right after the node.
+# Notice that the order is the order of evaluation of the matcher, not
+# the order of input arguments, since options and commands are matched
+# regardless of their positions.
+#
+# Instead of being interpreted, the AST is compiled by `compile(grammar)`
+# to a tree of pre-bound closures. Each closure accepts the
+# `MatchStateManager` of current parse and returns True to indicate
+# successfully match, False otherwise.
 class Terminal(object):
-    # derived class should override this attribute.
+    # derived class should override these attributes.
     _type_id = None
+    # outcome kinds accepted by the terminal.
+    _outcome_kinds = ()
+
+    _outcome_generators = {
+        Parser.BOOLEAN_OUTCOME: MatchStateManager.generate_boolean_outcome,
+        Parser.STRING_OUTCOME: MatchStateManager.generate_string_outcome,
+        Parser.STRING_LIST_OUTCOME:
+        MatchStateManager.generate_string_list_outcome,
+    }
 
     def __init__(self, value):
         self._value = value
         self._children = []
+        # resolved by `finalize`.
+        self.key = None
+        self.outcome_kind = None
 
     # generate token for matching.
     def token(self):
         return Token(self._type_id, self._value)
 
-    def _match(self, callbacks):
-        key = self.token()
-        for callback in callbacks:
-            if callback(key):
-                return True
-        return False
-
-    # return True indicates successfully match, False otherwise.
-    def match(self):
-        raise Exception("Terminal")
+    def analyze(self):
+        self.nullable = False
+        if self.outcome_kind is None:
+            # never match.
+            self.first = frozenset()
+            self.required = {}
+        else:
+            self.first = frozenset([self.key])
+            # `ARGUMENT` matches any unconsumed input argument.
+            if self._type_id == Token.ARGUMENT:
+                self.required = {}
+            else:
+                self.required = {self.key: 1}
+
+    def analyze_follow(self, follow):
+        self.follow = follow
+
+    def finalize(self, grammar):
+        self.key = Token.intern(self.token())
+        outcome_kind = grammar.get_outcome_kind(self.key)
+        if outcome_kind not in self._outcome_kinds:
+            outcome_kind = None
+        self.outcome_kind = outcome_kind
+
+    def compile(self, grammar):
+        key = self.key
+        generator = self._outcome_generators.get(self.outcome_kind)
+
+        if generator is None:
+            # not an outcome key, never match.
+            def match_terminal(manager):
+                return False
+        else:
+            def match_terminal(manager):
+                return generator(manager, key)
+        return match_terminal
 
 
 class PosixOption(Terminal):
     _type_id = Token.POSIX_OPTION
-
-    def match(self):
-        callbacks = [
-            MatchStateManager.try_to_generate_boolean_outcome,
-            MatchStateManager.try_to_generate_string_outcome,
-            MatchStateManager.try_to_generate_string_list_outcome,
-        ]
-        return self._match(callbacks)
+    _outcome_kinds = (
+        Parser.BOOLEAN_OUTCOME,
+        Parser.STRING_OUTCOME,
+        Parser.STRING_LIST_OUTCOME,
+    )
 
 
 class GnuOption(Terminal):
     _type_id = Token.GNU_OPTION
-
-    def match(self):
-        callbacks = [
-            MatchStateManager.try_to_generate_boolean_outcome,
-            MatchStateManager.try_to_generate_string_outcome,
-            MatchStateManager.try_to_generate_string_list_outcome,
-        ]
-        return self._match(callbacks)
+    _outcome_kinds = (
+        Parser.BOOLEAN_OUTCOME,
+        Parser.STRING_OUTCOME,
+        Parser.STRING_LIST_OUTCOME,
+    )
 
 
 class Command(Terminal):
     _type_id = Token.COMMAND
-
-    def match(self):
-        callbacks = [
-            MatchStateManager.try_to_generate_boolean_outcome,
-        ]
-        return self._match(callbacks)
+    _outcome_kinds = (
+        Parser.BOOLEAN_OUTCOME,
+    )
 
 
 class Argument(Terminal):
     _type_id = Token.ARGUMENT
-
-    def match(self):
-        callbacks = [
-            MatchStateManager.try_to_generate_string_outcome,
-            MatchStateManager.try_to_generate_string_list_outcome,
-        ]
-        return self._match(callbacks)
+    _outcome_kinds = (
+        Parser.STRING_OUTCOME,
+        Parser.STRING_LIST_OUTCOME,
+    )
 
 
 class NonTerminal(object):
@@ -470,88 +1407,300 @@ class NonTerminal(object):
     def get_forward_child(self):
         return self._children[0]
 
-    # return True indicates successfully match, False otherwise.
-    def match(self):
+    def finalize(self, grammar):
+        for child in self._children:
+            child.finalize(grammar)
+
+    def analyze(self):
+        for child in self._children:
+            child.analyze()
+        self._analyze()
+
+    # derived class should override this method to set `nullable`, `first`
+    # and `required`, based on attributes of children.
+    # default implementation is for nodes with single child.
+    def _analyze(self):
+        child = self.get_forward_child()
+        self.nullable = child.nullable
+        self.first = child.first
+        self.required = child.required
+
+    # `required` of a node that matches if one of its children matches.
+    def _intersect_required_of_children(self):
+        required = dict(self._children[0].required)
+        for child in self._children[1:]:
+            for key, count in list(required.items()):
+                child_count = child.required.get(key, 0)
+                if child_count:
+                    required[key] = min(count, child_count)
+                else:
+                    del required[key]
+        return required
+
+    # default implementation is for nodes with single child.
+    def analyze_follow(self, follow):
+        self.follow = follow
+        self.get_forward_child().analyze_follow(follow)
+
+    def _compile_children(self, grammar):
+        return tuple(
+            grammar.compile_node(child) for child in self._children
+        )
+
+    # wrap `match_node` to reject the node before descending into it, if
+    # input arguments lack the tokens it requires.
+    def _guard(self, grammar, match_node):
+        required = []
+        for key, count in self.required.items():
+            # a string list key could match a consumed token.
+            if grammar.is_string_list_key(key):
+                count = 1
+            required.append((key, count))
+        # subcommands rule out most of nodes, check them first.
+        required.sort(key=lambda item: item[0].type_id != Token.COMMAND)
+        anchored = is_anchored_by_first(self)
+        first = self.first
+
+        if not required and not anchored:
+            return match_node
+
+        def match_guarded(manager):
+            if required and not manager.contains_all(required):
+                return False
+            if anchored and not manager.contains_any(first):
+                return False
+            return match_node(manager)
+        return match_guarded
+
+    def compile(self, grammar):
         raise Exception("NonTerminal")
 
 
 class Doc(NonTerminal):
 
-    def match(self):
+    def finalize(self, grammar):
         logic_xor_node = self.get_forward_child()
         logic_xor_node.is_top_level = True
-        return logic_xor_node.match()
+        super(Doc, self).finalize(grammar)
+
+    def compile(self, grammar):
+        return grammar.compile_node(self.get_forward_child())
 
 
 class LogicAnd(NonTerminal):
 
-    def match(self):
-        MatchStateManager.push_rollback_point()
+    def _analyze(self):
+        self.nullable = True
+        first = set()
         for child in self._children:
-            if not child.match():
-                MatchStateManager.rollback()
-                return False
-        MatchStateManager.pop_rollback_point()
-        return True
+            first.update(child.first)
+            if not child.nullable:
+                self.nullable = False
+                break
+        self.first = frozenset(first)
+
+        self.required = {}
+        for child in self._children:
+            for key, count in child.required.items():
+                self.required[key] = self.required.get(key, 0) + count
+
+    def analyze_follow(self, follow):
+        self.follow = follow
+        for child in reversed(self._children):
+            child.analyze_follow(follow)
+            if child.nullable:
+                follow = follow | child.first
+            else:
+                follow = child.first
+
+    def compile(self, grammar):
+        children = self._compile_children(grammar)
+
+        def match_logic_and(manager):
+            manager.push_rollback_point()
+            for match_child in children:
+                if not match_child(manager):
+                    manager.rollback()
+                    return False
+            manager.pop_rollback_point()
+            return True
+        return self._guard(grammar, match_logic_and)
 
 
 class LogicXor(NonTerminal):
 
-    def match(self):
-        MatchStateManager.push_rollback_point()
-        match_flag = False
+    def _analyze(self):
+        self.nullable = any(child.nullable for child in self._children)
+        self.first = frozenset().union(
+            *[child.first for child in self._children]
+        )
+        self.required = self._intersect_required_of_children()
+
+    def analyze_follow(self, follow):
+        self.follow = follow
         for child in self._children:
-            match_in_child = child.match()
-            should_rollback = (match_in_child
-                               and getattr(self, 'is_top_level', False)
-                               and not MatchStateManager.all_match())
-            # handle top-level `LogicXor` node.
-            if should_rollback:
-                MatchStateManager.rollback()
-                # record initial state again.
-                MatchStateManager.push_rollback_point()
+            child.analyze_follow(follow)
+
+    # Children are indexed by keys of FIRST terminals, so that children
+    # could not possibly match are skipped. Since a failed match leaves no
+    # change of match state, skipping them makes no difference.
+    def _compile_dispatch(self, children):
+        branch_index = {}
+        always_try = []
+        for position, child in enumerate(self._children):
+            if not is_anchored_by_first(child):
+                always_try.append(position)
                 continue
-            # state: should not rollback.
-            # otherwise, break looping.
-            if match_in_child:
-                match_flag = True
-                break
-        MatchStateManager.pop_rollback_point()
-        return match_flag
+            for key in child.first:
+                branch_index.setdefault(key, []).append(position)
+
+        if not branch_index:
+            def select_children(manager):
+                return children
+            return select_children
+
+        # token keys of a manager never change, hence the selection is
+        # made once per manager.
+        dispatch_key = object()
+
+        def select_children(manager):
+            selected = manager.dispatch_cache.get(dispatch_key)
+            if selected is not None:
+                return selected
+            positions = set(always_try)
+            # loop over the smaller one.
+            if len(branch_index) <= manager.get_num_token_keys():
+                for key, key_positions in branch_index.items():
+                    if manager.search_match_token_indices(key):
+                        positions.update(key_positions)
+            else:
+                for key in manager.get_token_keys():
+                    positions.update(branch_index.get(key, ()))
+            selected = [children[position] for position in sorted(positions)]
+            manager.dispatch_cache[dispatch_key] = selected
+            return selected
+        return select_children
+
+    def compile(self, grammar):
+        children = self._compile_children(grammar)
+        select_children = self._compile_dispatch(children)
+        is_top_level = getattr(self, 'is_top_level', False)
+
+        def match_logic_xor(manager):
+            manager.push_rollback_point()
+            match_flag = False
+            for match_child in select_children(manager):
+                match_in_child = match_child(manager)
+                should_rollback = (match_in_child
+                                   and is_top_level
+                                   and not manager.all_match())
+                # handle top-level `LogicXor` node.
+                if should_rollback:
+                    manager.rollback()
+                    # record initial state again.
+                    manager.push_rollback_point()
+                    continue
+                # state: should not rollback.
+                # otherwise, break looping.
+                if match_in_child:
+                    match_flag = True
+                    break
+            manager.pop_rollback_point()
+            return match_flag
+        return self._guard(grammar, match_logic_xor)
 
 
 class LogicOr(NonTerminal):
 
-    def match(self):
-        one_or_more = False
-        for child in self._children:
-            if child.match():
-                one_or_more = True
-        return one_or_more
+    def _analyze(self):
+        self.nullable = any(child.nullable for child in self._children)
+        self.first = frozenset().union(
+            *[child.first for child in self._children]
+        )
+        self.required = self._intersect_required_of_children()
+
+    # all children are tried in order, and each of them might fail.
+    def analyze_follow(self, follow):
+        self.follow = follow
+        for child in reversed(self._children):
+            child.analyze_follow(follow)
+            follow = follow | child.first
+
+    def compile(self, grammar):
+        children = self._compile_children(grammar)
+
+        def match_logic_or(manager):
+            one_or_more = False
+            for match_child in children:
+                if match_child(manager):
+                    one_or_more = True
+            return one_or_more
+        return self._guard(grammar, match_logic_or)
 
 
 class LogicOptional(NonTerminal):
 
-    def match(self):
-        self.get_forward_child().match()
-        return True
+    def _analyze(self):
+        self.nullable = True
+        self.first = self.get_forward_child().first
+        self.required = {}
+
+    def compile(self, grammar):
+        match_child = grammar.compile_node(self.get_forward_child())
+
+        def match_logic_optional(manager):
+            match_child(manager)
+            return True
+        return match_logic_optional
 
 
 class LogicOneOrMore(NonTerminal):
 
-    def match(self):
+    def analyze_follow(self, follow):
+        self.follow = follow
         child = self.get_forward_child()
-        counter = -1
-        while True:
-            counter = counter + 1
-            if not child.match():
-                break
-        return counter > 0
+        child.analyze_follow(child.first | follow)
+
+    # return the string list terminal repeated by the node, skipping
+    # `LogicAnd` wrappers with single child, or None.
+    def _get_string_list_terminal(self):
+        child = self.get_forward_child()
+        while isinstance(child, LogicAnd) and len(child._children) == 1:
+            child = child.get_forward_child()
+        if (isinstance(child, Terminal)
+                and child.outcome_kind == Parser.STRING_LIST_OUTCOME):
+            return child
+        return None
+
+    def compile(self, grammar):
+        terminal = self._get_string_list_terminal()
+        if terminal is not None:
+            # fast path, i.e. `<file>...` or `-I <dir>...`.
+            key = terminal.key
+
+            def match_logic_one_or_more(manager):
+                return manager.generate_string_list_outcome_run(key) > 0
+            return self._guard(grammar, match_logic_one_or_more)
+
+        match_child = grammar.compile_node(self.get_forward_child())
+
+        def match_logic_one_or_more(manager):
+            counter = -1
+            while True:
+                counter = counter + 1
+                if not match_child(manager):
+                    break
+            return counter > 0
+        return self._guard(grammar, match_logic_one_or_more)
 
 
 # preprocessing algorithm of input arguments.
 # return a list of tokens.
 class ArgvPreprocessor(object):
+    # patterns of input arguments, compiled once.
+    ALNUM_CHARS = frozenset(string.ascii_letters + string.digits)
+    GNU_OPTION_REGEX = re.compile('^\\-\\-[a-zA-Z0-9][a-zA-Z0-9\\-]+$')
+
     POSIX_OPTION = 0
     GNU_OPTION = 1
     SINGLE_DASH_CASE = 2
@@ -562,50 +1711,90 @@ class ArgvPreprocessor(object):
     # `option_to_rep_option`: a dict contains mapping from option to its
     # representative option.
     # `bound_options`: a set of bound options.
-    def __init__(self, argv, option_to_rep_option, bound_options):
+    # `commands`: a set of commands.
+    # `oom_bound_options`: a set of oom bound options.
+    # `lookup_tables`: result of `build_lookup_tables`, derived from the
+    # tables above if not provided.
+    def __init__(self, argv, option_to_rep_option, bound_options,
+                 commands=frozenset(), oom_bound_options=frozenset(),
+                 lookup_tables=None):
         # ignore `argv[0]`.
         self._argv = []
         for arg in argv[1:]:
             arg = arg.decode('utf-8') if hasattr(arg, 'decode') else arg
             self._argv.append(arg)
 
-        self._option_to_rep_option = option_to_rep_option
-        self._bound_options = bound_options
+        if lookup_tables is None:
+            lookup_tables = self.build_lookup_tables(
+                option_to_rep_option, bound_options, commands,
+            )
+        (self._posix_option_map, self._gnu_option_map,
+         self._command_map, self._bound_option_values) = lookup_tables
+        self._oom_bound_options = oom_bound_options
         # preprocessed input arguments.
         self.tokens = []
+        # `[begin, end)` of tokens following the last occurrence of each
+        # oom bound option, recorded by `_scan_oom_bound_options`.
+        self._oom_runs = {}
+        self._open_oom_run = None
 
-    def _detect_argument_pattern(self, value):
-        # patterns.
-        ALNUM = '[a-zA-Z0-9]'
-        POSIX_OPTION_PATTERN = '^\\-{}$'.format(ALNUM)
-        GNU_OPTION_PATTERN = '^\\-\\-{0}({0}|\\-)+$'.format(ALNUM)
-
-        if re.match(POSIX_OPTION_PATTERN, value):
-            return self.POSIX_OPTION
-        if re.match(GNU_OPTION_PATTERN, value):
-            return self.GNU_OPTION
-        # state: not `POSIX_OPTION` or `GNU_OPTION`.
-        if len(value) <= 2:
-            return self.UNKNOW_CASE
-        # state: not `POSIX_OPTION` or `GNU_OPTION`.
-        #        len(value) > 2.
-        if value.startswith('--'):
-            return self.DOUBLE_DASH_CASE
-        # state: not `POSIX_OPTION` or `GNU_OPTION`.
+    # classify `value` by checking its leading characters, the regex is
+    # applied only to values beginning with "--".
+    @classmethod
+    def classify_argument(cls, value):
+        if value[:1] != '-':
+            return cls.UNKNOW_CASE
+        # state: startswith "-".
+        length = len(value)
+        if length <= 2:
+            if length == 2 and value[1] in cls.ALNUM_CHARS:
+                return cls.POSIX_OPTION
+            return cls.UNKNOW_CASE
+        # state: startswith "-".
         #        len(value) > 2.
-        #        not startswith "--".
-        if value.startswith('-'):
-            return self.SINGLE_DASH_CASE
-        # state: not `POSIX_OPTION` or `GNU_OPTION`.
+        if value[1] == '-':
+            if cls.GNU_OPTION_REGEX.match(value):
+                return cls.GNU_OPTION
+            return cls.DOUBLE_DASH_CASE
+        # state: startswith "-", not startswith "--".
         #        len(value) > 2.
-        #        not startswith "-".
-        return self.UNKNOW_CASE
+        if (length == 3 and value[2] == '\n'
+                and value[1] in cls.ALNUM_CHARS):
+            # like `$`, accept a trailing newline.
+            return cls.POSIX_OPTION
+        return cls.SINGLE_DASH_CASE
+
+    # split the `Token` keyed tables by type into dicts keyed by raw
+    # strings, so that tokenization does not allocate tokens for lookups.
+    # return `(posix_option_map, gnu_option_map, command_map,
+    # bound_option_values)`.
+    @classmethod
+    def build_lookup_tables(cls, option_to_rep_option, bound_options,
+                            commands):
+        posix_option_map = {}
+        gnu_option_map = {}
+        for option, rep_option in option_to_rep_option.items():
+            if option.type_id == Token.POSIX_OPTION:
+                posix_option_map[option.value] = rep_option
+            elif option.type_id == Token.GNU_OPTION:
+                gnu_option_map[option.value] = rep_option
+        command_map = dict(
+            (command.value, command) for command in commands
+        )
+        bound_option_values = frozenset(
+            option.value for option in bound_options
+        )
+        return (posix_option_map, gnu_option_map,
+                command_map, bound_option_values)
 
-    def _get_rep_option(self, type_id, value):
-        return self._option_to_rep_option.get(Token(type_id, value), None)
+    # batch mode of `classify_argument`.
+    @classmethod
+    def classify_argv(cls, values):
+        classify_argument = cls.classify_argument
+        return [classify_argument(value) for value in values]
 
     def _option_is_bound(self, option):
-        return option in self._bound_options
+        return option.value in self._bound_option_values
 
     def _add_general_element(self, value, dst=None):
         dst = dst or self.tokens
@@ -613,8 +1802,8 @@ class ArgvPreprocessor(object):
             Token(Token.GENERAL_ELEMENT, value),
         )
 
-    def _process_option(self, type_id, value):
-        option = self._get_rep_option(type_id, value)
+    def _process_option(self, option_map, value):
+        option = option_map.get(value)
         if option is None:
             self._add_general_element(value)
             return False
@@ -625,20 +1814,21 @@ class ArgvPreprocessor(object):
         return False
 
     def _process_posix_option(self, value):
-        return self._process_option(Token.POSIX_OPTION, value)
+        return self._process_option(self._posix_option_map, value)
 
     def _process_gnu_option(self, value):
-        return self._process_option(Token.GNU_OPTION, value)
+        return self._process_option(self._gnu_option_map, value)
 
     def _process_single_dash_case(self, value):
         # ignore '-'.
         chars = value[1:]
         tokens_cache = []
+        posix_option_map = self._posix_option_map
 
         skip_next_argument = False
         cur_char_index = 0
         for char in chars:
-            option = self._get_rep_option(Token.POSIX_OPTION, '-' + char)
+            option = posix_option_map.get('-' + char)
             if option is None:
                 break
             # state: valid option.
@@ -669,10 +1859,7 @@ class ArgvPreprocessor(object):
         split_flag = False
         equal_sign_index = value.find('=')
         if equal_sign_index not in [-1, len(value) - 1]:
-            option = self._get_rep_option(
-                Token.GNU_OPTION,
-                value[:equal_sign_index],
-            )
+            option = self._gnu_option_map.get(value[:equal_sign_index])
             if option and self._option_is_bound(option):
                 # find it!
                 self.tokens.append(option)
@@ -685,31 +1872,66 @@ class ArgvPreprocessor(object):
     def _process_unknow_case(self, value):
         if value == '--':
             return True
-        suspect_command = Token(Token.COMMAND, value)
-        if suspect_command in Info.commands:
-            self.tokens.append(suspect_command)
+        command = self._command_map.get(value)
+        if command is not None:
+            self.tokens.append(command)
         else:
             self._add_general_element(value)
         return False
 
+    # record runs of tokens in `self.tokens[begin:]`, return the index to
+    # be scanned next. a run starts after an occurrence of an oom bound
+    # option, and ends at the next occurrence of any oom bound option.
+    def _scan_oom_bound_options(self, begin):
+        tokens = self.tokens
+        end = len(tokens)
+        oom_bound_options = self._oom_bound_options
+        if not oom_bound_options:
+            return end
+        for index in range(begin, end):
+            token = tokens[index]
+            if token not in oom_bound_options:
+                continue
+            if self._open_oom_run is not None:
+                self._open_oom_run[1] = index
+            # overwrite the run of previous occurrence.
+            self._open_oom_run = [index + 1, end]
+            self._oom_runs[token] = self._open_oom_run
+        return end
+
+    # indexed by case.
+    def _get_case_functions(self):
+        return [
+            self._process_posix_option,
+            self._process_gnu_option,
+            self._process_single_dash_case,
+            self._process_double_dash_case,
+            self._process_unknow_case,
+        ]
+
+    # process `value` without context, i.e. neither after "--" nor the
+    # value of a bound option, append its tokens to `self.tokens`.
+    # return True if `value` is "--", or the next argument is the value of
+    # a bound option.
+    def process_argument(self, value):
+        case = self.classify_argument(value)
+        return self._get_case_functions()[case](value)
+
     def _fill_tokens(self):
-        case_function_mapping = {
-            self.POSIX_OPTION: self._process_posix_option,
-            self.GNU_OPTION: self._process_gnu_option,
-            self.SINGLE_DASH_CASE: self._process_single_dash_case,
-            self.DOUBLE_DASH_CASE: self._process_double_dash_case,
-            self.UNKNOW_CASE: self._process_unknow_case,
-        }
+        case_functions = self._get_case_functions()
+        cases = self.classify_argv(self._argv)
         skip_next_argument = False
+        scan_begin = 0
         for index, value in enumerate(self._argv):
             if skip_next_argument:
                 self._add_general_element(value)
                 skip_next_argument = False
                 continue
             # process `value`.
-            case = self._detect_argument_pattern(value)
-            function = case_function_mapping[case]
+            case = cases[index]
+            function = case_functions[case]
             flag = function(value)
+            scan_begin = self._scan_oom_bound_options(scan_begin)
             if case != self.UNKNOW_CASE:
                 skip_next_argument = flag
                 continue
@@ -719,23 +1941,625 @@ class ArgvPreprocessor(object):
                     self._add_general_element(value_after_double_dash)
                 break
 
+    # tokens in the recorded runs are retyped to general elements.
     def _correct_oom_argument_type(self):
-        matched_oom_bound_options = set()
-        next_oom_bound_option_index = len(self.tokens)
-        for index, token in reversed(list(enumerate(self.tokens))):
-            if (token in Info.oom_bound_options
-                    and token not in matched_oom_bound_options):
-                target_range = range(
-                    index + 1,
-                    next_oom_bound_option_index,
-                )
-                for target_index in target_range:
-                    self.tokens[target_index].type_id = Token.GENERAL_ELEMENT
-                # record oom_bound_option.
-                matched_oom_bound_options.add(token)
-            if token in Info.oom_bound_options:
-                next_oom_bound_option_index = index
-
-    def tokenize_argv(self):
-        self._fill_tokens()
+        tokens = self.tokens
+        # close the last run.
+        if self._open_oom_run is not None:
+            self._open_oom_run[1] = len(tokens)
+        for begin, end in self._oom_runs.values():
+            for index in range(begin, end):
+                token = tokens[index]
+                if token.type_id == Token.GENERAL_ELEMENT:
+                    continue
+                # replace instead of mutating the token, which might be
+                # shared with grammar tables.
+                tokens[index] = Token(Token.GENERAL_ELEMENT, token.value)
+
+    # if given, `run_phase(name, phase)` is called to run each phase, so
+    # that callers could observe them.
+    def tokenize_argv(self, run_phase=None):
+        if run_phase is None:
+            self._fill_tokens()
+            self._correct_oom_argument_type()
+            return
+        run_phase('fill_tokens', self._fill_tokens)
+        run_phase('correct_oom_argument_type',
+                  self._correct_oom_argument_type)
+
+    # retype `self.tokens` filled by `process_argument` as `tokenize_argv`
+    # does.
+    def correct_tokens(self):
+        self._oom_runs = {}
+        self._open_oom_run = None
+        self._scan_oom_bound_options(0)
         self._correct_oom_argument_type()
+
+
+# Serialized grammar.
+#
+# Grammar of a generated module is built by a function of the module, and
+# cached in the `__pycache__` directory next to the module by
+# `load_cached_grammar`. The cache is a marshalled tuple of
+# `(GRAMMAR_FORMAT_VERSION, digest of doc text and builder, data)`, where
+# `data` is produced by `dump_grammar`:
+#
+# * a dict of tables, `Token` is dumped as `(type_id, value)`.
+# * a flat node table in post-order, each entry is
+#   `(index in GRAMMAR_NODE_CLASSES, value of terminal or indices of
+#   children)`. The last entry is the root.
+#
+# Branches of the top-level `LogicXor` leading by a `Command` are dumped
+# as entries of `LazyBranch`, whose argument is `(value of command, node
+# table of the branch)`. Such branches are materialized on the first
+# match of input arguments containing the command, so that the cost of
+# startup depends on the subcommand used, instead of the whole doc.
+GRAMMAR_FORMAT_VERSION = 2
+
+
+# placeholder of a serialized branch leading by command `command`.
+class LazyBranch(object):
+
+    def __init__(self, command, node_table):
+        self._command = command
+        self._node_table = node_table
+        # resolved by `finalize`.
+        self.key = None
+
+    # build the branch from its node table.
+    def materialize(self):
+        return build_nodes(self._node_table)
+
+    def finalize(self, grammar):
+        self.key = Token.intern(Token(Token.COMMAND, self._command))
+        if not grammar.is_boolean_key(self.key):
+            # not a command, never match.
+            self.key = None
+
+    # approximation of the branch, which is enough for the dispatch of
+    # `LogicXor` and guards.
+    def analyze(self):
+        self.nullable = False
+        if self.key is None:
+            self.first = frozenset()
+            self.required = {}
+        else:
+            self.first = frozenset([self.key])
+            self.required = {self.key: 1}
+
+    def analyze_follow(self, follow):
+        self.follow = follow
+
+    def compile(self, grammar):
+        if self.key is None:
+            def match_lazy_branch(manager):
+                return False
+            return match_lazy_branch
+
+        first = self.first
+        follow = self.follow
+        # compiled branch, shared by calls of this grammar.
+        compiled = []
+
+        def match_lazy_branch(manager):
+            if not manager.contains_any(first):
+                return False
+            if not compiled:
+                branch = self.materialize()
+                branch.finalize(grammar)
+                branch.analyze()
+                branch.analyze_follow(follow)
+                compiled.append(grammar.compile_node(branch))
+            return compiled[0](manager)
+        return match_lazy_branch
+
+
+GRAMMAR_NODE_CLASSES = (
+    PosixOption, GnuOption, Command, Argument,
+    Doc, LogicAnd, LogicXor, LogicOr, LogicOptional, LogicOneOrMore,
+    LazyBranch,
+)
+# terminal classes come first.
+GRAMMAR_NUM_TERMINAL_CLASSES = 4
+GRAMMAR_TOKEN_SETS = (
+    'bound_options', 'unbound_options', 'arguments',
+    'oom_bound_options', 'oom_arguments', 'commands',
+)
+GRAMMAR_TOKEN_MAPS = ('posix_option_map', 'gnu_option_map', 'command_map')
+
+
+# `info` could be a `Parser` as well, which has the same attributes.
+def dump_grammar(info):
+    def dump_token(token):
+        return (token.type_id, token.value)
+
+    tables = {}
+    for name in GRAMMAR_TOKEN_SETS:
+        tables[name] = [dump_token(token) for token in getattr(info, name)]
+    tables['default_values'] = [
+        (dump_token(key), value)
+        for key, value in info.default_values.items()
+    ]
+    tables['option_to_representative_option'] = [
+        (dump_token(option), dump_token(rep_option))
+        for option, rep_option in (
+            info.option_to_representative_option.items()
+        )
+    ]
+    # lookup tables are optional.
+    for name in GRAMMAR_TOKEN_MAPS:
+        table = getattr(info, name)
+        if table is not None:
+            tables[name] = [
+                (value, dump_token(token)) for value, token in table.items()
+            ]
+    if info.bound_option_values is not None:
+        tables['bound_option_values'] = list(info.bound_option_values)
+
+    return (tables, dump_nodes(info.doc_node, lazy=True))
+
+
+# return the leading command of `node`, or None.
+def get_leading_command(node):
+    if isinstance(node, LogicAnd) and isinstance(node._children[0], Command):
+        return node._children[0]._value
+    return None
+
+
+# return node table of `root`. if `lazy` is True, branches of the
+# top-level `LogicXor` are dumped as `LazyBranch` if possible.
+def dump_nodes(root, lazy=False):
+    class_indices = dict(
+        (node_class, index)
+        for index, node_class in enumerate(GRAMMAR_NODE_CLASSES)
+    )
+    # `id` of branches of the top-level `LogicXor`.
+    branch_ids = set()
+    if lazy and isinstance(root, Doc):
+        top_level_node = root.get_forward_child()
+        if isinstance(top_level_node, LogicXor):
+            branch_ids.update(map(id, top_level_node._children))
+    nodes = []
+
+    def dump_node(node):
+        node_class = type(node)
+        command = None
+        if id(node) in branch_ids:
+            command = get_leading_command(node)
+
+        if isinstance(node, Terminal):
+            argument = node._value
+        elif isinstance(node, LazyBranch):
+            argument = (node._command, node._node_table)
+        elif command is not None:
+            node_class = LazyBranch
+            argument = (command, dump_nodes(node))
+        else:
+            argument = [dump_node(child) for child in node._children]
+        nodes.append((class_indices[node_class], argument))
+        return len(nodes) - 1
+
+    dump_node(root)
+    return nodes
+
+
+# inverse of `dump_nodes`, return the root.
+def build_nodes(node_table):
+    nodes = []
+    append = nodes.append
+    for class_index, argument in node_table:
+        node_class = GRAMMAR_NODE_CLASSES[class_index]
+        if class_index < GRAMMAR_NUM_TERMINAL_CLASSES:
+            append(node_class(argument))
+        elif node_class is LazyBranch:
+            append(LazyBranch(argument[0], argument[1]))
+        else:
+            node = node_class()
+            node._children = [nodes[index] for index in argument]
+            append(node)
+    return nodes[-1]
+
+
+# inverse of `dump_grammar`, set attributes of `info`.
+def load_grammar(info, data):
+    tables, node_table = data
+
+    def load_token(pair):
+        return Token(pair[0], pair[1])
+
+    for name in GRAMMAR_TOKEN_SETS:
+        setattr(info, name, set(map(load_token, tables[name])))
+    info.default_values = dict(
+        (load_token(key), value) for key, value in tables['default_values']
+    )
+    info.option_to_representative_option = dict(
+        (load_token(option), load_token(rep_option))
+        for option, rep_option in tables['option_to_representative_option']
+    )
+    for name in GRAMMAR_TOKEN_MAPS:
+        table = tables.get(name)
+        if table is not None:
+            table = dict((value, load_token(token)) for value, token in table)
+        setattr(info, name, table)
+    bound_option_values = tables.get('bound_option_values')
+    if bound_option_values is not None:
+        bound_option_values = set(bound_option_values)
+    info.bound_option_values = bound_option_values
+
+    info.doc_node = build_nodes(node_table)
+
+
+def get_grammar_cache_path(module_path):
+    directory, filename = os.path.split(os.path.abspath(module_path))
+    name = os.path.splitext(filename)[0]
+    return os.path.join(directory, '__pycache__', name + '.grammar')
+
+
+# return the digest validating the cached grammar, which covers the doc
+# text and the code of `build_grammar`, so that the cache is invalidated
+# once the module is regenerated by another version of the front end.
+def get_grammar_digest(info, build_grammar):
+    code = build_grammar.__code__
+    digest = hashlib.sha1(info.doc_text.encode('utf-8'))
+    digest.update(marshal.dumps(
+        (code.co_code, code.co_consts, code.co_names),
+    ))
+    return digest.hexdigest()
+
+
+# load grammar of `info` from the cache of module `module_path`, which is
+# invalidated by the digest of `get_grammar_digest`. otherwise, grammar is
+# built by `build_grammar` and then cached. failure of writing the cache
+# is ignored. return True if the cache is loaded.
+def load_cached_grammar(info, build_grammar, module_path):
+    digest = get_grammar_digest(info, build_grammar)
+    cache_path = get_grammar_cache_path(module_path)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            content = cache_file.read()
+        version, cached_digest, data = marshal.loads(content)
+        if version == GRAMMAR_FORMAT_VERSION and cached_digest == digest:
+            load_grammar(info, data)
+            return True
+    except (EnvironmentError, EOFError, ValueError, TypeError,
+            IndexError, KeyError):
+        # missing or broken cache.
+        pass
+
+    build_grammar()
+    content = marshal.dumps(
+        (GRAMMAR_FORMAT_VERSION, digest, dump_grammar(info)),
+    )
+    # write to a temporary file, then rename it atomically.
+    temporary_path = '{0}.{1}'.format(cache_path, os.getpid())
+    try:
+        directory = os.path.dirname(cache_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(temporary_path, 'wb') as cache_file:
+            cache_file.write(content)
+        getattr(os, 'replace', os.rename)(temporary_path, cache_path)
+    except EnvironmentError:
+        try:
+            os.remove(temporary_path)
+        except EnvironmentError:
+            pass
+    return False
+
+
+# Prefix matching.
+#
+# Match incomplete input arguments, e.g. the words typed so far in a shell
+# completion or a REPL, against usage branches, i.e. children of the top
+# level `LogicXor` (or the only top level node). A branch is alive if the
+# tokens of the prefix do not exceed its bounds: the maximum number of
+# occurrences of each option and command, and the number of arguments.
+# General elements following bound options, or in runs of oom bound
+# options, are taken as values of options instead of arguments. Bounds
+# ignore the order of other tokens, so an alive branch might still reject
+# every completion of the prefix, while a dead branch never matches.
+#
+# States of prefixes are cached by `PrefixMatcher`. Appending a word to a
+# cached prefix tokenizes only the new word and checks only the branches
+# alive in the cached state, unless an oom bound option is involved, in
+# which case the tokens of the whole prefix are retyped.
+
+INFINITY = float('inf')
+
+
+# return `(max_counts, capacity)` of the branch `node`. `max_counts` maps
+# keys of options and commands to their maximum number of occurrences,
+# `capacity` is the maximum number of arguments.
+def get_prefix_bounds(grammar, node):
+    max_counts = defaultdict(int)
+    # boxed for the closure.
+    capacity = [0]
+
+    def collect(node, multiplicity):
+        if isinstance(node, LazyBranch):
+            node = node.materialize()
+        if isinstance(node, Terminal):
+            key = Token.intern(node.token())
+            outcome_kind = grammar.get_outcome_kind(key)
+            if outcome_kind not in node._outcome_kinds:
+                # never match.
+                return
+            # a string list key could match a consumed token.
+            if outcome_kind == Parser.STRING_LIST_OUTCOME:
+                multiplicity = INFINITY
+            if key.type_id == Token.ARGUMENT:
+                capacity[0] += multiplicity
+            else:
+                max_counts[key] += multiplicity
+            return
+        if isinstance(node, LogicOneOrMore):
+            multiplicity = INFINITY
+        for child in node._children:
+            collect(child, multiplicity)
+
+    collect(node, 1)
+    return dict(max_counts), capacity[0]
+
+
+# return True if `counts` of keys and the number of `arguments` are within
+# `bounds` of a branch. commands beyond bounds could be arguments.
+def is_within_prefix_bounds(bounds, counts, arguments):
+    max_counts, capacity = bounds
+    for key, count in counts.items():
+        excess = count - max_counts.get(key, 0)
+        if excess <= 0:
+            continue
+        if key.type_id != Token.COMMAND:
+            return False
+        arguments += excess
+    return arguments <= capacity
+
+
+# state of a prefix of input arguments, created by `PrefixMatcher`.
+# `alive` is the tuple of indices of alive branches, `branches` is the
+# tuple of alive branch nodes.
+class PrefixState(object):
+
+    def __init__(self, matcher, parent, words, new_tokens,
+                 skip_next_argument, after_double_dash, oom_seen,
+                 counts, arguments, alive):
+        self._matcher = matcher
+        self._parent = parent
+        self.words = words
+        # tokens of the last word before oom correction.
+        self._new_tokens = new_tokens
+        self._skip_next_argument = skip_next_argument
+        self._after_double_dash = after_double_dash
+        self._oom_seen = oom_seen
+        self._counts = counts
+        self._arguments = arguments
+        self.alive = alive
+        # resolved on demand.
+        self._next = None
+
+    @property
+    def branches(self):
+        return tuple(self._matcher.get_branch(index) for index in self.alive)
+
+    # tokens of the prefix before oom correction.
+    def get_raw_tokens(self):
+        chunks = []
+        state = self
+        while state is not None:
+            chunks.append(state._new_tokens)
+            state = state._parent
+        tokens = []
+        for chunk in reversed(chunks):
+            tokens.extend(chunk)
+        return tokens
+
+    # `(next_keys, accepts_argument)`, resolved by alive branches.
+    def _resolve_next(self):
+        if self._next is not None:
+            return self._next
+        next_keys = set()
+        accepts_argument = False
+        for index in self.alive:
+            bounds = self._matcher.get_bounds(index)
+            if is_within_prefix_bounds(
+                    bounds, self._counts, self._arguments + 1):
+                accepts_argument = True
+            for key, max_count in bounds[0].items():
+                if self._counts.get(key, 0) < max_count:
+                    next_keys.add(key)
+        if self._skip_next_argument:
+            # the value of a bound option.
+            next_keys = set()
+            accepts_argument = True
+        else:
+            if self._after_double_dash:
+                next_keys = set()
+            if self._oom_seen and self.alive:
+                # a value in the run of an oom bound option, which
+                # continues after "--".
+                accepts_argument = True
+        self._next = (frozenset(next_keys), accepts_argument)
+        return self._next
+
+    # keys of options and commands acceptable as the next token.
+    @property
+    def next_keys(self):
+        return self._resolve_next()[0]
+
+    # True if a general element is acceptable as the next token.
+    @property
+    def accepts_argument(self):
+        return self._resolve_next()[1]
+
+    # return the state of the prefix followed by `word`.
+    def extend(self, word):
+        grammar = self._matcher.grammar
+        bound_options = grammar.bound_options | grammar.oom_bound_options
+        word = word.decode('utf-8') if hasattr(word, 'decode') else word
+        words = self.words + (word,)
+
+        skip_next_argument = False
+        after_double_dash = self._after_double_dash
+        argv_prepprocessor = grammar.create_preprocessor([])
+        if self._skip_next_argument or after_double_dash:
+            argv_prepprocessor._add_general_element(word)
+        elif argv_prepprocessor.process_argument(word):
+            if word == '--':
+                after_double_dash = True
+            else:
+                skip_next_argument = True
+        new_tokens = tuple(argv_prepprocessor.tokens)
+
+        if any(token in grammar.oom_bound_options for token in new_tokens):
+            # the retyped runs might change, retype the whole prefix.
+            raw_tokens = self.get_raw_tokens()
+            raw_tokens.extend(new_tokens)
+            argv_prepprocessor.tokens = list(raw_tokens)
+            argv_prepprocessor.correct_tokens()
+            in_runs = set()
+            for begin, end in argv_prepprocessor._oom_runs.values():
+                in_runs.update(range(begin, end))
+            counts = {}
+            arguments = 0
+            previous_token = None
+            for index, token in enumerate(argv_prepprocessor.tokens):
+                if token.type_id != Token.GENERAL_ELEMENT:
+                    counts[token] = counts.get(token, 0) + 1
+                elif (index not in in_runs
+                        and previous_token not in bound_options):
+                    arguments += 1
+                previous_token = raw_tokens[index]
+            candidates = range(self._matcher.num_branches)
+            oom_seen = True
+        else:
+            # counts only grow, alive branches only shrink.
+            counts = dict(self._counts)
+            arguments = self._arguments
+            oom_seen = self._oom_seen
+            if not oom_seen:
+                # otherwise, in the run of the last oom bound option.
+                previous_token = self._get_last_raw_token()
+                for token in new_tokens:
+                    if token.type_id != Token.GENERAL_ELEMENT:
+                        counts[token] = counts.get(token, 0) + 1
+                    elif previous_token not in bound_options:
+                        arguments += 1
+                    previous_token = token
+            candidates = self.alive
+
+        alive = tuple(
+            index for index in candidates
+            if is_within_prefix_bounds(
+                self._matcher.get_bounds(index), counts, arguments,
+            )
+        )
+        return PrefixState(
+            self._matcher, self, words, new_tokens,
+            skip_next_argument, after_double_dash, oom_seen,
+            counts, arguments, alive,
+        )
+
+    def _get_last_raw_token(self):
+        state = self
+        while state is not None:
+            if state._new_tokens:
+                return state._new_tokens[-1]
+            state = state._parent
+        return None
+
+
+# bounded LRU cache of `PrefixState`, keyed by `argv[1:]`. a prefix not
+# cached is extended from its longest cached prefix.
+class PrefixMatcher(object):
+
+    CacheInfo = ParseCache.CacheInfo
+
+    def __init__(self, grammar, maxsize=256):
+        self.grammar = grammar
+        self._maxsize = maxsize
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # `(node, bounds)` of branches, resolved on demand.
+        self._branches = None
+
+    def _load_branches(self):
+        with self._lock:
+            if self._branches is not None:
+                return self._branches
+            top_level_node = self.grammar.doc_node.get_forward_child()
+            if isinstance(top_level_node, LogicXor):
+                nodes = top_level_node._children
+            else:
+                nodes = [top_level_node]
+            self._branches = [
+                (node, get_prefix_bounds(self.grammar, node))
+                for node in nodes
+            ]
+            return self._branches
+
+    @property
+    def num_branches(self):
+        return len(self._branches or self._load_branches())
+
+    def get_branch(self, index):
+        return (self._branches or self._load_branches())[index][0]
+
+    def get_bounds(self, index):
+        return (self._branches or self._load_branches())[index][1]
+
+    # return the longest cached prefix of `words`, or None.
+    def _lookup(self, words):
+        with self._lock:
+            for end in range(len(words), -1, -1):
+                state = self._states.get(words[:end])
+                if state is None:
+                    continue
+                # move to the most recently used end.
+                del self._states[state.words]
+                self._states[state.words] = state
+                if end == len(words):
+                    self._hits += 1
+                else:
+                    self._misses += 1
+                return state
+            self._misses += 1
+            return None
+
+    def _store(self, state):
+        with self._lock:
+            self._states[state.words] = state
+            while len(self._states) > self._maxsize:
+                self._states.popitem(last=False)
+
+    def match(self, argv):
+        words = tuple(
+            arg.decode('utf-8') if hasattr(arg, 'decode') else arg
+            for arg in argv[1:]
+        )
+        state = self._lookup(words)
+        if state is None:
+            state = PrefixState(
+                self, None, (), (), False, False, False,
+                {}, 0, tuple(range(self.num_branches)),
+            )
+            self._store(state)
+        # extend without lock, states are immutable.
+        for word in words[len(state.words):]:
+            state = state.extend(word)
+            self._store(state)
+        return state
+
+    def cache_info(self):
+        with self._lock:
+            return self.CacheInfo(
+                self._hits, self._misses,
+                self._maxsize, len(self._states),
+            )
+
+    def cache_clear(self):
+        with self._lock:
+            self._states.clear()
+            self._hits = 0
+            self._misses = 0
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Shell completion server
+
+A long-lived process loads grammars of generated modules once, and
+answers "what may come next after these words" over a Unix socket, so
+that completion costs a socket round trip instead of an interpreter
+start. ``scripts/clidoc_completion.bash`` is the client shim for bash.
+
+Protocol, one request per connection, all text is UTF-8:
+
+* request: a line of tab separated fields, the grammar name, the word
+  being completed, then the words before it (without the program name).
+* response: one candidate per line, then the server closes the
+  connection.
+
+Usage::
+
+    python -m clidoc.completion serve SOCKET NAME=MODULE_PATH...
+    python -m clidoc.completion complete SOCKET NAME [WORD...] CURRENT
+"""
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import argparse
+import errno
+import os
+import signal
+import socket
+import stat
+import sys
+import weakref
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+__all__ = [
+    'load_parser',
+    'complete',
+    'CompletionServer',
+    'request_completion',
+]
+
+
+def load_parser(module_path):
+    """Import the generated module at `module_path`, return its parser."""
+    name = os.path.splitext(os.path.basename(module_path))[0]
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        module = imp.load_source(name, module_path)
+    else:
+        spec = importlib.util.spec_from_file_location(name, module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module.Parser(module.Info)
+
+
+# spellings of each key of parsers.
+_spelling_tables = weakref.WeakKeyDictionary()
+
+
+def _get_spellings(parser):
+    spellings = _spelling_tables.get(parser)
+    if spellings is None:
+        spellings = {}
+        for option, rep_option in (
+                parser.option_to_representative_option.items()):
+            spellings.setdefault(rep_option, []).append(option.value)
+        for command in parser.commands:
+            spellings.setdefault(command, []).append(command.value)
+        _spelling_tables[parser] = spellings
+    return spellings
+
+
+def complete(parser, words, current=''):
+    """Return sorted candidates of the word after `words`.
+
+    Candidates are options (with all their spellings) and commands
+    acceptable after `words`, see :meth:`clidoc.codegen.Parser.match_prefix`,
+    beginning with `current`. States of `words` are cached by `parser`, so
+    completing the next word extends the state of `words`.
+    """
+    state = parser.match_prefix(['utility_name'] + list(words))
+    spellings = _get_spellings(parser)
+
+    candidates = set()
+    for key in state.next_keys:
+        candidates.update(spellings.get(key, ()))
+    return sorted(
+        candidate for candidate in candidates
+        if candidate.startswith(current)
+    )
+
+
+class _CompletionHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline().decode('utf-8').rstrip('\n')
+        fields = line.split('\t')
+        parser = self.server.parsers.get(fields[0])
+        if parser is None or len(fields) < 2:
+            return
+        current, words = fields[1], fields[2:]
+        for candidate in complete(parser, words, current):
+            self.wfile.write((candidate + '\n').encode('utf-8'))
+
+
+class CompletionServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    """Serve completion of `parsers`, a dict of grammar name to parser."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, parsers):
+        # remove the socket left by a previous server, but never other
+        # files.
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise OSError(errno.EEXIST, 'not a socket', socket_path)
+            os.remove(socket_path)
+        self.parsers = parsers
+        socketserver.UnixStreamServer.__init__(
+            self, socket_path, _CompletionHandler,
+        )
+
+
+def request_completion(socket_path, grammar, words, current=''):
+    """Client of :class:`CompletionServer`, return the candidates."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        request = '\t'.join([grammar, current] + list(words)) + '\n'
+        client.sendall(request.encode('utf-8'))
+        chunks = []
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    return b''.join(chunks).decode('utf-8').splitlines()
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = arg_parser.add_subparsers(dest='action')
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('socket')
+    serve_parser.add_argument('grammars', nargs='+',
+                              help='NAME=MODULE_PATH of generated modules.')
+    complete_parser = subparsers.add_parser('complete')
+    complete_parser.add_argument('socket')
+    complete_parser.add_argument('grammar')
+    complete_parser.add_argument('words', nargs='*')
+    options = arg_parser.parse_args(args)
+
+    if options.action == 'serve':
+        parsers = {}
+        for grammar in options.grammars:
+            name, module_path = grammar.split('=', 1)
+            parsers[name] = load_parser(module_path)
+        server = CompletionServer(options.socket, parsers)
+        # clean up on termination as well.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(options.socket)
+        return 0
+
+    words = options.words or ['']
+    for candidate in request_completion(
+            options.socket, options.grammar, words[:-1], words[-1]):
+        print(candidate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
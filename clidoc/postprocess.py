@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Post-processing of generated modules
+
+The front end (``clidoc_main -m python``) writes the engine
+(``clidoc/codegen.py``) followed by flat module-level statements building
+the grammar. This step rewrites the grammar into the form the engine
+expects:
+
+* statements other than ``Info.doc_text = ...`` are wrapped in
+  ``build_grammar()``, which is called through ``load_cached_grammar``.
+* lookup tables keyed by raw strings (``Info.posix_option_map``,
+  ``Info.gnu_option_map``, ``Info.command_map`` and
+  ``Info.bound_option_values``) are generated from the token tables,
+  unless the front end emits them.
+* in runtime mode, the embedded engine is replaced with the header
+  ``clidoc/runtime_codegen.py``.
+
+Modules already post-processed keep their grammar, so the step could be
+applied repeatedly. ``scripts/update.sh`` runs it after the front end.
+
+Usage::
+
+    python -m clidoc.postprocess [--runtime] MODULE_PATH...
+"""
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import argparse
+import ast
+import io
+import json
+import os
+import re
+import sys
+
+from clidoc import codegen
+
+
+__all__ = [
+    'postprocess',
+    'postprocess_file',
+]
+
+
+RUNTIME_HEADER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'runtime_codegen.py',
+)
+
+_TOKEN_TYPE_NAMES = {
+    codegen.Token.POSIX_OPTION: 'POSIX_OPTION',
+    codegen.Token.GNU_OPTION: 'GNU_OPTION',
+    codegen.Token.GENERAL_ELEMENT: 'GENERAL_ELEMENT',
+    codegen.Token.COMMAND: 'COMMAND',
+    codegen.Token.ARGUMENT: 'ARGUMENT',
+}
+
+_INDENT = '    '
+
+
+def _render_string(value):
+    return json.dumps(value)
+
+
+def _render_token(token):
+    return 'Token(Token.{0}, {1})'.format(
+        _TOKEN_TYPE_NAMES[token.type_id], _render_string(token.value),
+    )
+
+
+def _render_lookup_tables(info):
+    posix_option_map, gnu_option_map, command_map, bound_option_values = (
+        codegen.ArgvPreprocessor.build_lookup_tables(
+            info.option_to_representative_option,
+            set(info.bound_options) | set(info.oom_bound_options),
+            info.commands,
+        )
+    )
+    lines = []
+    for name, table in [('posix_option_map', posix_option_map),
+                        ('gnu_option_map', gnu_option_map),
+                        ('command_map', command_map)]:
+        lines.append('Info.{0} = {{'.format(name))
+        for value in sorted(table):
+            lines.append('{0}{1}: {2},'.format(
+                _INDENT, _render_string(value), _render_token(table[value]),
+            ))
+        lines.append('}')
+    lines.append('Info.bound_option_values = set([')
+    for value in sorted(bound_option_values):
+        lines.append('{0}{1},'.format(_INDENT, _render_string(value)))
+    lines.append('])')
+    return lines
+
+
+# return `(begin, end)` line ranges, 0-based, of top level statements of
+# `source`.
+def _get_statement_ranges(source, num_lines):
+    begins = [statement.lineno - 1 for statement in ast.parse(source).body]
+    return list(zip(begins, begins[1:] + [num_lines]))
+
+
+def _is_doc_text_statement(lines):
+    return lines[0].startswith('Info.doc_text')
+
+
+def _is_node_statement(lines):
+    return lines[0].startswith('node_')
+
+
+# evaluate the flat grammar statements, return the `Info` built.
+def _evaluate_grammar(source):
+
+    class GrammarInfo(codegen.Info):
+        pass
+
+    namespace = dict(
+        (name, getattr(codegen, name))
+        for name in ['Token', 'PosixOption', 'GnuOption', 'Command',
+                     'Argument', 'Doc', 'LogicAnd', 'LogicXor', 'LogicOr',
+                     'LogicOptional', 'LogicOneOrMore']
+    )
+    namespace['Info'] = GrammarInfo
+    exec(compile(source, '<grammar>', 'exec'), namespace)
+    return GrammarInfo
+
+
+# wrap flat grammar statements `tail`, return the new tail.
+def _wrap_grammar(tail):
+    lines = tail.splitlines()
+    ranges = _get_statement_ranges(tail, len(lines))
+    doc_text_lines = []
+    grammar_statements = []
+    for begin, end in ranges:
+        statement_lines = lines[begin:end]
+        if _is_doc_text_statement(statement_lines):
+            doc_text_lines.extend(statement_lines)
+        else:
+            grammar_statements.append(statement_lines)
+
+    grammar_source = '\n'.join(
+        line for statement_lines in grammar_statements
+        for line in statement_lines
+    ) + '\n'
+    info = _evaluate_grammar(grammar_source)
+    builder_lines = []
+    tables_added = 'posix_option_map' in vars(info)
+    for statement_lines in grammar_statements:
+        # lookup tables come before nodes.
+        if _is_node_statement(statement_lines) and not tables_added:
+            builder_lines.extend(_render_lookup_tables(info))
+            tables_added = True
+        builder_lines.extend(statement_lines)
+    if not tables_added:
+        builder_lines.extend(_render_lookup_tables(info))
+
+    new_lines = list(doc_text_lines)
+    new_lines.append('def build_grammar():')
+    new_lines.extend(
+        _INDENT + line if line.strip() else line for line in builder_lines
+    )
+    new_lines.append('load_cached_grammar(Info, build_grammar, __file__)')
+    return '\n'.join(new_lines) + '\n'
+
+
+def postprocess(text, runtime_header=None):
+    """Return the post-processed source of a generated module.
+
+    :param text: source written by the front end
+    :param runtime_header: source of ``clidoc/runtime_codegen.py`` to
+        switch to runtime mode, or None to keep the embedded engine
+    """
+    # the grammar starts at the first generated "Info." statement.
+    start = re.search(r'^Info\.', text, re.M).start()
+    prefix, tail = text[:start], text[start:]
+    if not re.search(r'^def build_grammar\(\):', tail, re.M):
+        tail = _wrap_grammar(tail)
+    if runtime_header is not None:
+        prefix = runtime_header
+    return prefix + tail
+
+
+def postprocess_file(module_path, runtime=False):
+    """Post-process the generated module at `module_path` in place."""
+    runtime_header = None
+    if runtime:
+        with io.open(RUNTIME_HEADER_PATH, encoding='utf-8') as header_file:
+            runtime_header = header_file.read()
+    with io.open(module_path, encoding='utf-8') as module_file:
+        text = module_file.read()
+    with io.open(module_path, 'w', encoding='utf-8') as module_file:
+        module_file.write(postprocess(text, runtime_header))
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--runtime', action='store_true',
+                            help='switch to runtime mode.')
+    arg_parser.add_argument('modules', nargs='+',
+                            help='paths of generated modules.')
+    options = arg_parser.parse_args(args)
+    for module_path in options.modules:
+        postprocess_file(module_path, options.runtime)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
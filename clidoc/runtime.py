@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Shared engine of generated modules
+
+Modules generated in runtime mode (see ``clidoc/runtime_codegen.py``)
+import the engine from here instead of embedding a copy of
+``clidoc/codegen.py``, hence the engine is loaded once per process.
+"""
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+from clidoc.codegen import (SYSTEM_EXIT_OFF, PRINT_DOC_OFF, GUIDELINE_8_OFF,
+                            PARSE_CACHE_ON, PARSE_STATS_ON, bind_clidoc,
+                            copy_outcome, split_comma_separated_oom_outcome,
+                            Token, Info, Parser, InstrumentedParser,
+                            ParseCache, ParseFailure, ParseStats, ParseTrace,
+                            TracingParser, PrefixMatcher, PrefixState,
+                            MatchState, MatchStateManager, Terminal,
+                            PosixOption, GnuOption, Command, Argument,
+                            NonTerminal, Doc, LogicAnd, LogicXor, LogicOr,
+                            LogicOptional, LogicOneOrMore, ArgvPreprocessor,
+                            LazyBranch, dump_grammar, load_grammar, dump_nodes,
+                            build_nodes, get_grammar_cache_path,
+                            load_cached_grammar)
+
+
+__all__ = [
+    'SYSTEM_EXIT_OFF',
+    'PRINT_DOC_OFF',
+    'GUIDELINE_8_OFF',
+    'PARSE_CACHE_ON',
+    'PARSE_STATS_ON',
+    'bind_clidoc',
+    'copy_outcome',
+    'split_comma_separated_oom_outcome',
+    'Token',
+    'Info',
+    'Parser',
+    'InstrumentedParser',
+    'ParseCache',
+    'ParseFailure',
+    'ParseStats',
+    'ParseTrace',
+    'TracingParser',
+    'PrefixMatcher',
+    'PrefixState',
+    'MatchState',
+    'MatchStateManager',
+    'Terminal',
+    'PosixOption',
+    'GnuOption',
+    'Command',
+    'Argument',
+    'NonTerminal',
+    'Doc',
+    'LogicAnd',
+    'LogicXor',
+    'LogicOr',
+    'LogicOptional',
+    'LogicOneOrMore',
+    'ArgvPreprocessor',
+    'LazyBranch',
+    'dump_grammar',
+    'load_grammar',
+    'dump_nodes',
+    'build_nodes',
+    'get_grammar_cache_path',
+    'load_cached_grammar',
+]
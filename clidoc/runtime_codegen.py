@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+# Header of modules generated in runtime mode. Grammar data is appended
+# to this file, as to `codegen.py` in the default mode, but the engine is
+# imported from `clidoc.runtime` instead of being embedded.
+from clidoc.runtime import (SYSTEM_EXIT_OFF, PRINT_DOC_OFF, GUIDELINE_8_OFF,
+                            PARSE_CACHE_ON, PARSE_STATS_ON, bind_clidoc,
+                            load_cached_grammar, Token, Info as RuntimeInfo,
+                            Parser, InstrumentedParser, ParseCache,
+                            ParseFailure, ParseStats, ParseTrace,
+                            TracingParser, PrefixMatcher, PrefixState,
+                            PosixOption, GnuOption, Command, Argument, Doc,
+                            LogicAnd, LogicXor, LogicOr, LogicOptional,
+                            LogicOneOrMore)
+
+
+__all__ = [
+    'SYSTEM_EXIT_OFF',
+    'PRINT_DOC_OFF',
+    'GUIDELINE_8_OFF',
+    'PARSE_CACHE_ON',
+    'PARSE_STATS_ON',
+    'clidoc',
+    'clidoc_cache_info',
+    'clidoc_stats',
+    'Parser',
+    'InstrumentedParser',
+    'ParseCache',
+    'ParseFailure',
+    'ParseStats',
+    'ParseTrace',
+    'TracingParser',
+    'PrefixMatcher',
+    'PrefixState',
+]
+
+
+# grammar of this module.
+class Info(RuntimeInfo):
+    pass
+
+
+clidoc, clidoc_cache_info, clidoc_stats = bind_clidoc(Info)
@@ -12,7 +12,8 @@ sys.path.append('.')
 from setup import (
     setup_dict, get_project_files, print_success_message,
     print_failure_message, _lint, _test, _test_all,
-    CODE_DIRECTORY, DOCS_DIRECTORY, TESTS_DIRECTORY, PYTEST_FLAGS)
+    CODE_DIRECTORY, DOCS_DIRECTORY, TESTS_DIRECTORY, BENCHMARKS_DIRECTORY,
+    PYTEST_FLAGS)
 
 from paver.easy import options, task, needs, consume_args
 from paver.setuputils import install_distutils_tasks
@@ -133,6 +134,18 @@ def run(args):
     raise SystemExit(main([CODE_DIRECTORY] + args))
 
 
+@task
+@consume_args
+def benchmark(args):
+    """Run the benchmark suite and compare results against the baseline.
+    All arguments are passed to it, e.g. `paver benchmark --save-baseline'.
+    """
+    retcode = subprocess.call(
+        [sys.executable, os.path.join(BENCHMARKS_DIRECTORY, 'benchmark.py')]
+        + args)
+    raise SystemExit(retcode)
+
+
 @task
 def commit():
     """Commit only if all the tests pass."""
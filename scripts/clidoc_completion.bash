@@ -0,0 +1,38 @@
+#!/bin/bash
+# Bash completion shim of `python -m clidoc.completion serve`.
+#
+# Usage, in ~/.bashrc:
+#
+#   export CLIDOC_COMPLETION_SOCKET=/tmp/clidoc-completion.sock
+#   source /path/to/clidoc_completion.bash
+#   clidoc_register_completion utility_name GRAMMAR_NAME
+#
+# Requires `socat` or a `nc` supporting `-U`.
+
+_clidoc_request() {
+	if command -v socat >/dev/null 2>&1; then
+		socat - "UNIX-CONNECT:${CLIDOC_COMPLETION_SOCKET}"
+	else
+		nc -U "${CLIDOC_COMPLETION_SOCKET}"
+	fi
+}
+
+_clidoc_complete() {
+	local grammar="${_CLIDOC_GRAMMARS[$1]}"
+	local current="${COMP_WORDS[COMP_CWORD]}"
+	local request="${grammar}"$'\t'"${current}"
+	local word
+	for word in "${COMP_WORDS[@]:1:COMP_CWORD-1}"; do
+		request+=$'\t'"${word}"
+	done
+	local IFS=$'\n'
+	COMPREPLY=($(printf '%s\n' "${request}" | _clidoc_request 2>/dev/null))
+}
+
+declare -A _CLIDOC_GRAMMARS
+
+# clidoc_register_completion COMMAND GRAMMAR_NAME
+clidoc_register_completion() {
+	_CLIDOC_GRAMMARS[$1]="$2"
+	complete -o default -F _clidoc_complete "$1"
+}
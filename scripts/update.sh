@@ -7,9 +7,13 @@ CLIDOC_MAIN_PATH="${CLIDOC_BUILD_DIR}/src/clidoc_main"
 TARGET_DIR1="${CLIDOC_SOURCE_DIR}/resource/python"
 TARGET_DIR2="${CLIDOC_BUILD_DIR}/resource/python"
 CODEGEN_PY_PATH="${CLIDOC_PYTHON_SOURCE_DIR}/clidoc/codegen.py"
+# header of modules generated in runtime mode.
+RUNTIME_CODEGEN_PY_PATH="${CLIDOC_PYTHON_SOURCE_DIR}/clidoc/runtime_codegen.py"
 
 cp ${CODEGEN_PY_PATH} ${TARGET_DIR1}
 cp ${CODEGEN_PY_PATH} ${TARGET_DIR2}
+cp ${RUNTIME_CODEGEN_PY_PATH} ${TARGET_DIR1}
+cp ${RUNTIME_CODEGEN_PY_PATH} ${TARGET_DIR2}
 
 DOC_NAMES=(command default_value logic option_binding simple_option argument)
 TEST_DOCS_PATH="${CLIDOC_SOURCE_DIR}/test/test_docs"
@@ -17,3 +21,16 @@ for doc_name in ${DOC_NAMES[@]}; do
 	${CLIDOC_MAIN_PATH} -m python "${TEST_DOCS_PATH}/$doc_name" \
                       "${CLIDOC_PYTHON_SOURCE_DIR}/tests/clidoc_${doc_name}.py"
 done
+
+# wrap the grammar for the cache and add lookup tables of the
+# preprocessor, see clidoc/postprocess.py. some modules are switched to
+# runtime mode, i.e. the embedded engine is replaced with the header.
+RUNTIME_DOC_NAMES=(command default_value logic option_binding argument)
+for doc_name in ${DOC_NAMES[@]}; do
+	RUNTIME_FLAG=""
+	if [[ " ${RUNTIME_DOC_NAMES[@]} " == *" ${doc_name} "* ]]; then
+		RUNTIME_FLAG="--runtime"
+	fi
+	PYTHONPATH="${CLIDOC_PYTHON_SOURCE_DIR}" python -m clidoc.postprocess \
+		${RUNTIME_FLAG} "${CLIDOC_PYTHON_SOURCE_DIR}/tests/clidoc_${doc_name}.py"
+done
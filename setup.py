@@ -38,6 +38,7 @@ sys.path.insert(0, os.path.abspath('.'))
 CODE_DIRECTORY = 'clidoc'
 DOCS_DIRECTORY = 'docs'
 TESTS_DIRECTORY = 'tests'
+BENCHMARKS_DIRECTORY = 'benchmarks'
 PYTEST_FLAGS = ['--doctest-modules']
 
 # Import metadata. Normally this would just be:
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import sys
+
+
+collect_ignore = []
+# `clidoc.aio` requires async generators.
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import asyncio
+
+import pytest
+
+from clidoc.aio import AsyncParser
+from clidoc.codegen import (Token, Info, Parser, Argument, LogicOneOrMore,
+                            Doc, ParseFailure)
+
+
+files = Token(Token.ARGUMENT, '<file>')
+
+
+class FilesInfo(Info):
+    bound_options = set()
+    unbound_options = set()
+    arguments = set()
+    oom_bound_options = set()
+    oom_arguments = {files}
+    commands = set()
+    default_values = {}
+    option_to_representative_option = {}
+    doc_text = 'Usage: utility_name <file>...'
+
+
+def create_parser():
+    one_or_more_files = LogicOneOrMore()
+    one_or_more_files.add_child(Argument(files.value))
+    FilesInfo.doc_node = Doc()
+    FilesInfo.doc_node.add_child(one_or_more_files)
+    return Parser(FilesInfo)
+
+
+def run(awaitable):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+# collect results of an async generator, without async syntax.
+def collect(async_generator):
+
+    def step():
+        return async_generator.__anext__()
+
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                results.append(loop.run_until_complete(step()))
+            except StopAsyncIteration:
+                return results
+    finally:
+        loop.close()
+
+
+def test_parse():
+    async_parser = AsyncParser(create_parser(), inline_max_arguments=2)
+
+    # inline.
+    assert {'<file>': ['a', 'b']} == run(
+        async_parser.parse(['utility_name', 'a', 'b']),
+    )
+    # in executor.
+    assert {'<file>': ['a', 'b', 'c']} == run(
+        async_parser.parse(['utility_name', 'a', 'b', 'c']),
+    )
+    failure = run(async_parser.parse(['utility_name']))
+    assert ParseFailure.NO_ARGUMENT == failure.reason
+
+
+def test_parse_many_async():
+    argv_list = [['utility_name', str(index)] for index in range(50)]
+    argv_list[33] = ['utility_name']
+    async_parser = AsyncParser(create_parser(), max_concurrency=2,
+                               batch_size=4)
+
+    results = collect(async_parser.parse_many_async(iter(argv_list)))
+    assert 50 == len(results)
+    assert {'<file>': ['32']} == results[32]
+    assert (33, ParseFailure.NO_ARGUMENT) == (results[33].index,
+                                              results[33].reason)
+
+
+def test_parse_many_async_close():
+    argv_list = [['utility_name', str(index)] for index in range(50)]
+    async_parser = AsyncParser(create_parser(), max_concurrency=2,
+                               batch_size=4)
+    results = async_parser.parse_many_async(argv_list)
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert {'<file>': ['0']} == loop.run_until_complete(
+            results.__anext__(),
+        )
+        # pending batches are cancelled.
+        loop.run_until_complete(results.aclose())
+        with pytest.raises(StopAsyncIteration):
+            loop.run_until_complete(results.__anext__())
+    finally:
+        loop.close()
@@ -2,29 +2,49 @@
 from __future__ import (division, absolute_import, print_function,
                         unicode_literals)
 
+import json
+import os
+import shutil
+import tempfile
+import threading
+
 from clidoc.codegen import (Token, ArgvPreprocessor, Info, MatchStateManager,
-                            MatchState)
+                            MatchState, Parser, PosixOption, GnuOption,
+                            Command, Argument, LogicAnd, LogicXor,
+                            LogicOptional, LogicOneOrMore, Doc, ParseCache,
+                            ParseFailure, load_cached_grammar,
+                            get_grammar_cache_path, load_grammar,
+                            dump_grammar, LazyBranch, PrefixState,
+                            InstrumentedParser, TracingParser,
+                            PRINT_DOC_OFF, SYSTEM_EXIT_OFF, GUIDELINE_8_OFF)
 
 
 # init info.
-Info.unbound_options = [Token(Token.POSIX_OPTION, '-a')]
-Info.commands = [Token(Token.COMMAND, 'command')]
+class TestInfo(Info):
+    unbound_options = [Token(Token.POSIX_OPTION, '-a')]
+    commands = [Token(Token.COMMAND, 'command')]
+
+    bound_options = [Token(Token.GNU_OPTION, '--foo')]
+    arguments = [Token(Token.ARGUMENT, '<arg>')]
+
+    oom_bound_options = [Token(Token.POSIX_OPTION, '-b')]
+    oom_arguments = [Token(Token.ARGUMENT, 'BAR')]
 
-Info.bound_options = [Token(Token.GNU_OPTION, '--foo')]
-Info.arguments = [Token(Token.ARGUMENT, '<arg>')]
+    default_values = {Token(Token.ARGUMENT, 'BAR'): "42"}
+    option_to_representative_option = {}
 
-Info.oom_bound_options = [Token(Token.POSIX_OPTION, '-b')]
-Info.oom_arguments = [Token(Token.ARGUMENT, 'BAR')]
 
-Info.default_values = {Token(Token.ARGUMENT, 'BAR'): "42"}
+parser = Parser(TestInfo)
 
-Info.load_tokens([
-    Token(Token.POSIX_OPTION, '-a'),
-    Token(Token.POSIX_OPTION, '-b'),
-    Token(Token.GENERAL_ELEMENT, 'foobar'),
-    Token(Token.GENERAL_ELEMENT, 'foobar'),
-    Token(Token.POSIX_OPTION, '-b'),
-])
+
+def create_manager():
+    return MatchStateManager(parser, [
+        Token(Token.POSIX_OPTION, '-a'),
+        Token(Token.POSIX_OPTION, '-b'),
+        Token(Token.GENERAL_ELEMENT, 'foobar'),
+        Token(Token.GENERAL_ELEMENT, 'foobar'),
+        Token(Token.POSIX_OPTION, '-b'),
+    ])
 
 
 def test_tokenization():
@@ -44,6 +64,10 @@ def test_tokenization():
         Token(Token.GNU_OPTION, "--long-option"),
     }
 
+    commands = {
+        Token(Token.COMMAND, "command"),
+    }
+
     argv = [
         "utility_name",
 
@@ -65,7 +89,9 @@ def test_tokenization():
         "-c",
         "--long",
     ]
-    preprocessor = ArgvPreprocessor(argv, option_to_rep_option, bound_options)
+    preprocessor = ArgvPreprocessor(
+        argv, option_to_rep_option, bound_options, commands,
+    )
     preprocessor.tokenize_argv()
 
     expected = [
@@ -93,42 +119,1012 @@ def test_tokenization():
     ]
     assert expected == preprocessor.tokens
 
+    # observe phases.
+    phases = []
+
+    def run_phase(name, phase):
+        phases.append(name)
+        phase()
+    observed_preprocessor = ArgvPreprocessor(
+        argv, option_to_rep_option, bound_options, commands,
+    )
+    observed_preprocessor.tokenize_argv(run_phase)
+    assert ['fill_tokens', 'correct_oom_argument_type'] == phases
+    assert expected == observed_preprocessor.tokens
+
+
+def test_oom_correction_keeps_grammar_tokens():
+    rep_option = Token(Token.POSIX_OPTION, "-c")
+    oom_bound_option = Token(Token.POSIX_OPTION, "-e")
+    option_to_rep_option = {
+        Token(Token.POSIX_OPTION, "-c"): rep_option,
+        Token(Token.POSIX_OPTION, "-e"): oom_bound_option,
+    }
+    preprocessor = ArgvPreprocessor(
+        ["utility_name", "-e", "a", "-c"],
+        option_to_rep_option,
+        {oom_bound_option},
+        oom_bound_options={oom_bound_option},
+    )
+    preprocessor.tokenize_argv()
+
+    assert Token(Token.GENERAL_ELEMENT, '-c') == preprocessor.tokens[-1]
+    assert Token.POSIX_OPTION == rep_option.type_id
+
+
+def test_oom_correction_runs():
+    include = Token(Token.POSIX_OPTION, "-I")
+    library = Token(Token.POSIX_OPTION, "-L")
+    flag = Token(Token.POSIX_OPTION, "-c")
+    preprocessor = ArgvPreprocessor(
+        ["utility_name",
+         "-I", "a", "-c", "-L", "b", "-I", "-c", "d", "-L", "e", "-c"],
+        {include: include, library: library, flag: flag},
+        {include, library},
+        oom_bound_options={include, library},
+    )
+    preprocessor.tokenize_argv()
+
+    # only the runs after the last occurrences are retyped.
+    expected = [
+        include, Token(Token.GENERAL_ELEMENT, 'a'), flag,
+        library, Token(Token.GENERAL_ELEMENT, 'b'),
+        include,
+        Token(Token.GENERAL_ELEMENT, '-c'), Token(Token.GENERAL_ELEMENT, 'd'),
+        library,
+        Token(Token.GENERAL_ELEMENT, 'e'), Token(Token.GENERAL_ELEMENT, '-c'),
+    ]
+    assert expected == preprocessor.tokens
+    assert preprocessor.tokens[2] is flag
+
 
 def test_info():
-    assert Info.is_boolean_key(
+    assert parser.is_boolean_key(
         Token(Token.POSIX_OPTION, '-a'),
     )
-    assert Info.is_boolean_key(
+    assert parser.is_boolean_key(
         Token(Token.COMMAND, 'command'),
     )
-    assert Info.is_string_key(
+    assert parser.is_string_key(
         Token(Token.GNU_OPTION, '--foo'),
     )
-    assert Info.is_string_key(
+    assert parser.is_string_key(
         Token(Token.ARGUMENT, '<arg>'),
     )
-    assert Info.is_string_list_key(
+    assert parser.is_string_list_key(
         Token(Token.POSIX_OPTION, '-b'),
     )
-    assert Info.is_string_list_key(
+    assert parser.is_string_list_key(
         Token(Token.ARGUMENT, 'BAR'),
     )
-    assert [1, 4] == Info.search_match_token_indices(
+
+    manager = create_manager()
+    assert [1, 4] == manager.search_match_token_indices(
         Token(Token.POSIX_OPTION, '-b'),
     )
-    assert [2, 3] == Info.search_match_token_indices(
+    assert [2, 3] == manager.search_match_token_indices(
         Token(Token.GENERAL_ELEMENT, 'foobar'),
     )
-    assert [] == Info.search_match_token_indices(
+    assert [] == manager.search_match_token_indices(
         Token(Token.GENERAL_ELEMENT, 'not exist'),
     )
 
 
+def test_terminal_finalization():
+    terminals = [
+        PosixOption('-a'),
+        Command('command'),
+        GnuOption('--foo'),
+        Argument('BAR'),
+        PosixOption('-b'),
+        Command('not-exist'),
+        Argument('-a'),
+    ]
+    for terminal in terminals:
+        terminal.finalize(parser)
+
+    expected_kinds = [
+        Parser.BOOLEAN_OUTCOME,
+        Parser.BOOLEAN_OUTCOME,
+        Parser.STRING_OUTCOME,
+        Parser.STRING_LIST_OUTCOME,
+        Parser.STRING_LIST_OUTCOME,
+        None,
+        None,
+    ]
+    assert expected_kinds == [t.outcome_kind for t in terminals]
+    # keys are interned, same as tokens of grammar tables.
+    assert terminals[0].key is Token.intern(Token(Token.POSIX_OPTION, '-a'))
+    assert [terminals[3].key] == [
+        key for key in parser.oom_arguments if key is terminals[3].key
+    ]
+
+
+def test_token():
+    token = Token(Token.POSIX_OPTION, '-a')
+    same_token = Token(Token.POSIX_OPTION, '-a')
+    assert token == same_token
+    assert not token != same_token
+    assert token != Token(Token.COMMAND, '-a')
+    assert hash(token) == hash(same_token)
+    assert not hasattr(token, '__dict__')
+
+    interned = Token.intern(token)
+    assert interned is Token.intern(same_token)
+    assert interned == token
+
+
 def test_match_state_manager_state_change():
-    MatchStateManager.init(MatchState(Info))
-    assert not any(MatchStateManager._match_state._consumed_flags)
-    MatchStateManager.push_rollback_point()
-    MatchStateManager._match_state._consumed_flags[0] = True
-    assert any(MatchStateManager._match_state._consumed_flags)
-    MatchStateManager.rollback()
-    assert not any(MatchStateManager._match_state._consumed_flags)
+    manager = create_manager()
+    assert not any(manager._match_state._consumed_flags)
+    manager.push_rollback_point()
+    manager._match_state.set_consumed_flag(0)
+    assert any(manager._match_state._consumed_flags)
+    manager.rollback()
+    assert not any(manager._match_state._consumed_flags)
+
+
+def test_match_state_manager_nested_rollback():
+    manager = create_manager()
+    match_state = manager._match_state
+    a = Token(Token.POSIX_OPTION, '-a')
+    b = Token(Token.POSIX_OPTION, '-b')
+    arg = Token(Token.ARGUMENT, '<arg>')
+
+    manager.push_rollback_point()
+    match_state.add_boolean_outcome(a)
+    match_state.set_consumed_flag(0)
+
+    manager.push_rollback_point()
+    match_state.add_string_list_outcome(b, 'foobar')
+    match_state.add_string_outcome(arg, 'foobar')
+    match_state.set_consumed_flag(1)
+    match_state.set_consumed_flag(2)
+    manager.rollback()
+
+    outcome = manager.get_outcome()
+    assert outcome['-a']
+    assert [] == outcome['-b']
+    assert "" == outcome['<arg>']
+    assert [True, False, False, False, False] == match_state._consumed_flags
+
+    manager.rollback()
+    assert not manager.get_outcome()['-a']
+    assert not any(match_state._consumed_flags)
+
+
+def create_parser(doc_node, **tables):
+
+    class DocInfo(Info):
+        bound_options = set()
+        unbound_options = set()
+        arguments = set()
+        oom_bound_options = set()
+        oom_arguments = set()
+        commands = set()
+        default_values = {}
+        option_to_representative_option = {}
+        doc_text = 'Usage:'
+    DocInfo.doc_node = doc_node
+    for name, value in tables.items():
+        setattr(DocInfo, name, value)
+    return Parser(DocInfo)
+
+
+def create_doc(*branches):
+    logic_xor = LogicXor()
+    for branch in branches:
+        logic_xor.add_child(branch)
+    doc = Doc()
+    doc.add_child(logic_xor)
+    return doc
+
+
+def test_parser_instances_are_independent():
+
+    def create_option_parser(option_value):
+        option = Token(Token.POSIX_OPTION, option_value)
+        return create_parser(
+            create_doc(PosixOption(option_value)),
+            unbound_options={option},
+            option_to_representative_option={option: option},
+        )
+
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+    parser_x = create_option_parser('-x')
+    parser_y = create_option_parser('-y')
+    failures = []
+
+    def worker(target, valid, invalid):
+        for _ in range(200):
+            if not target.parse(['utility_name', valid], mode):
+                failures.append(valid)
+            if target.parse(['utility_name', invalid], mode):
+                failures.append(invalid)
+
+    threads = [
+        threading.Thread(target=worker, args=(parser_x, '-x', '-y')),
+        threading.Thread(target=worker, args=(parser_y, '-y', '-x')),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+
+
+def test_logic_xor_dispatch():
+    commands = ['cmd{0}'.format(index) for index in range(20)]
+    branches = []
+    for command in commands:
+        branch = LogicAnd()
+        branch.add_child(Command(command))
+        branch.add_child(Argument('<arg>'))
+        branches.append(branch)
+    # fallback branch, could not be indexed.
+    fallback = LogicOneOrMore()
+    fallback.add_child(Argument('<file>'))
+    branches.append(fallback)
+
+    doc = create_doc(*branches)
+    parser = create_parser(
+        doc,
+        commands={Token(Token.COMMAND, command) for command in commands},
+        arguments={Token(Token.ARGUMENT, '<arg>')},
+        oom_arguments={Token(Token.ARGUMENT, '<file>')},
+    )
+    assert {Token(Token.COMMAND, 'cmd3')} == branches[3].first
+    assert not fallback.nullable
+
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+    outcome = parser.parse(['utility_name', 'cmd7', 'value'], mode)
+    assert outcome['cmd7']
+    assert not outcome['cmd3']
+    assert 'value' == outcome['<arg>']
+    assert [] == outcome['<file>']
+
+    outcome = parser.parse(['utility_name', 'a', 'b'], mode)
+    assert ['a', 'b'] == outcome['<file>']
+    assert not any(outcome[command] for command in commands)
+
+    outcome = parser.parse(['utility_name', 'cmd7'], mode)
+    assert ['cmd7'] == outcome['<file>']
+
+
+def test_static_analysis():
+    # utility_name [-a] (-b | cmd) <arg>... [-c]
+    a, b, c = PosixOption('-a'), PosixOption('-b'), PosixOption('-c')
+    cmd, arg = Command('cmd'), Argument('<arg>')
+    optional_a = LogicOptional()
+    optional_a.add_child(a)
+    logic_xor = LogicXor()
+    logic_xor.add_child(b)
+    logic_xor.add_child(cmd)
+    one_or_more_arg = LogicOneOrMore()
+    one_or_more_arg.add_child(arg)
+    optional_c = LogicOptional()
+    optional_c.add_child(c)
+    logic_and = LogicAnd()
+    for child in (optional_a, logic_xor, one_or_more_arg, optional_c):
+        logic_and.add_child(child)
+
+    option_tokens = {
+        Token(Token.POSIX_OPTION, value) for value in ('-a', '-b', '-c')
+    }
+    create_parser(
+        create_doc(logic_and),
+        unbound_options=option_tokens,
+        commands={Token(Token.COMMAND, 'cmd')},
+        oom_arguments={Token(Token.ARGUMENT, '<arg>')},
+    )
+
+    assert optional_a.nullable
+    assert not logic_and.nullable
+    assert {a.key, b.key, cmd.key} == logic_and.first
+    assert {b.key, cmd.key} == logic_xor.first
+
+    assert not logic_and.follow
+    assert {b.key, cmd.key} == a.follow
+    assert {arg.key} == logic_xor.follow
+    assert {arg.key, c.key} == arg.follow
+    assert {c.key} == one_or_more_arg.follow
+    assert not c.follow
+
+
+def test_logic_and_guard():
+    # utility_name [-a] cmd | utility_name <arg>
+    a, cmd, arg = PosixOption('-a'), Command('cmd'), Argument('<arg>')
+    optional_a = LogicOptional()
+    optional_a.add_child(a)
+    logic_and = LogicAnd()
+    logic_and.add_child(optional_a)
+    logic_and.add_child(cmd)
+
+    parser = create_parser(
+        create_doc(logic_and, arg),
+        unbound_options={Token(Token.POSIX_OPTION, '-a')},
+        commands={Token(Token.COMMAND, 'cmd')},
+        arguments={Token(Token.ARGUMENT, '<arg>')},
+        option_to_representative_option={
+            Token(Token.POSIX_OPTION, '-a'): Token(Token.POSIX_OPTION, '-a'),
+        },
+    )
+    manager = parser.create_manager(parser.tokenize(['utility_name', 'x']))
+    assert not logic_and.compile(parser)(manager)
+    assert manager.all_match() is False
+
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+    assert parser.parse(['utility_name', '-a', 'cmd'], mode)['-a']
+    assert 'x' == parser.parse(['utility_name', 'x'], mode)['<arg>']
+    assert not parser.parse(['utility_name', '-a'], mode)
+
+
+def test_nested_logic_xor_dispatch():
+    # `(<x> | -v)...`
+    x = Token(Token.ARGUMENT, '<x>')
+    verbose = Token(Token.POSIX_OPTION, '-v')
+    logic_xor = LogicXor()
+    logic_xor.add_child(Argument(x.value))
+    logic_xor.add_child(PosixOption(verbose.value))
+    one_or_more = LogicOneOrMore()
+    one_or_more.add_child(logic_xor)
+
+    class NestedInfo(Info):
+        bound_options = set()
+        unbound_options = {verbose}
+        arguments = {x}
+        oom_bound_options = set()
+        oom_arguments = set()
+        commands = set()
+        default_values = {}
+        option_to_representative_option = {verbose: verbose}
+    NestedInfo.doc_node = create_doc(one_or_more)
+    nested_parser = InstrumentedParser(NestedInfo)
+
+    def count_probes(num_arguments):
+        argv = ['utility_name', '-v']
+        argv.extend('a{0}'.format(index) for index in range(num_arguments))
+        assert nested_parser.parse_result(argv)
+        return nested_parser.get_stats().last.skip_table_probes
+
+    # linear in the number of arguments.
+    assert count_probes(400) <= 2 * count_probes(200) + 10
+
+
+def test_required_prefilter():
+    # utility_name cmd -v -v [-o FILE]... | utility_name (cmd | -v) -o FILE
+    tokens = {
+        'cmd': Token(Token.COMMAND, 'cmd'),
+        '-v': Token(Token.POSIX_OPTION, '-v'),
+        '-o': Token(Token.POSIX_OPTION, '-o'),
+    }
+    optional_o = LogicOptional()
+    one_or_more_o = LogicOneOrMore()
+    one_or_more_o.add_child(PosixOption('-o'))
+    optional_o.add_child(one_or_more_o)
+    verbose = LogicAnd()
+    for child in (Command('cmd'), PosixOption('-v'), PosixOption('-v'),
+                  optional_o):
+        verbose.add_child(child)
+
+    cmd_or_v = LogicXor()
+    cmd_or_v.add_child(Command('cmd'))
+    cmd_or_v.add_child(PosixOption('-v'))
+    output = LogicAnd()
+    output.add_child(cmd_or_v)
+    output.add_child(PosixOption('-o'))
+
+    parser = create_parser(
+        create_doc(verbose, output),
+        unbound_options={tokens['-v']},
+        oom_bound_options={tokens['-o']},
+        commands={tokens['cmd']},
+        option_to_representative_option={
+            tokens['-v']: tokens['-v'],
+            tokens['-o']: tokens['-o'],
+        },
+    )
+    assert {tokens['cmd']: 1, tokens['-v']: 2} == verbose.required
+    assert {} == cmd_or_v.required
+    assert {tokens['-o']: 1} == output.required
+
+    manager = parser.create_manager(
+        parser.tokenize(['utility_name', 'cmd', '-v', '-o', 'FILE']),
+    )
+    assert manager.contains_all([(tokens['cmd'], 1), (tokens['-v'], 1)])
+    assert not manager.contains_all([(tokens['-v'], 2)])
+
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+    outcome = parser.parse(['utility_name', 'cmd', '-vv'], mode)
+    assert outcome['-v']
+    assert [] == outcome['-o']
+    outcome = parser.parse(['utility_name', '-v', '-o', 'FILE'], mode)
+    assert ['FILE'] == outcome['-o']
+    assert not parser.parse(['utility_name', 'cmd', '-v'], mode)
+
+
+def test_match_state_first_unconsumed_index():
+    match_state = MatchState(parser, 6)
+    assert 0 == match_state.get_first_unconsumed_index()
+
+    mark = match_state.mark()
+    for index in (0, 1, 2, 4):
+        match_state.set_consumed_flag(index)
+    assert 3 == match_state.get_first_unconsumed_index()
+    assert 3 == match_state.get_first_unconsumed_index(1)
+    assert 5 == match_state.get_first_unconsumed_index(4)
+
+    inner_mark = match_state.mark()
+    match_state.set_consumed_flag(3)
+    match_state.set_consumed_flag(5)
+    assert match_state.get_first_unconsumed_index() is None
+    assert match_state.all_match()
+
+    match_state.undo(inner_mark)
+    assert not match_state.all_match()
+    assert 3 == match_state.get_first_unconsumed_index()
+    assert 5 == match_state.get_first_unconsumed_index(4)
+
+    match_state.undo(mark)
+    assert 0 == match_state.get_first_unconsumed_index()
+    assert 2 == match_state.get_first_unconsumed_index(2)
+    assert list(range(7)) == match_state._next_unconsumed
+
+
+def test_one_or_more_fast_path():
+    include = Token(Token.POSIX_OPTION, '-I')
+    files = Token(Token.ARGUMENT, '<file>')
+    parser = create_parser(
+        None,
+        oom_bound_options={include},
+        oom_arguments={files},
+        option_to_representative_option={include: include},
+    )
+    cases = [
+        (include, ['utility_name', '-I', 'a', 'b', '-Ic', '-I', 'd', 'e']),
+        (files, ['utility_name', 'a', 'b', 'c', '-I', 'd']),
+    ]
+
+    def run_slow_path(key, argv):
+        manager = parser.create_manager(parser.tokenize(argv))
+        while manager.generate_string_list_outcome(key):
+            pass
+        return manager
+
+    for key, argv in cases:
+        expected = run_slow_path(key, argv)
+        manager = parser.create_manager(parser.tokenize(argv))
+        manager.push_rollback_point()
+        assert 3 <= manager.generate_string_list_outcome_run(key)
+        assert expected.get_outcome() == manager.get_outcome()
+        assert (expected._match_state._consumed_flags
+                == manager._match_state._consumed_flags)
+
+        manager.rollback()
+        assert [] == manager.get_outcome()[key.value]
+        assert not any(manager._match_state._consumed_flags)
+
+    outcome = run_slow_path(include, cases[0][1]).get_outcome()
+    # `b` is left to other elements, as in the original matcher.
+    assert ['a', 'c', 'd', 'e'] == outcome['-I']
+    outcome = run_slow_path(files, cases[1][1]).get_outcome()
+    assert ['a', 'b', 'c'] == outcome['<file>']
+
+
+def test_classify_argv():
+    values = ['-a', '--long-a', '-abc', '--a=b', '--', '-', 'a', '', '-=']
+    expected = [
+        ArgvPreprocessor.POSIX_OPTION,
+        ArgvPreprocessor.GNU_OPTION,
+        ArgvPreprocessor.SINGLE_DASH_CASE,
+        ArgvPreprocessor.DOUBLE_DASH_CASE,
+        ArgvPreprocessor.UNKNOW_CASE,
+        ArgvPreprocessor.UNKNOW_CASE,
+        ArgvPreprocessor.UNKNOW_CASE,
+        ArgvPreprocessor.UNKNOW_CASE,
+        ArgvPreprocessor.UNKNOW_CASE,
+    ]
+    assert expected == ArgvPreprocessor.classify_argv(values)
+    assert expected == [ArgvPreprocessor.classify_argument(value)
+                        for value in values]
+
+
+def test_lookup_tables():
+    tokens = dict(
+        (token.value, token) for token in [
+            Token(Token.POSIX_OPTION, '-c'),
+            Token(Token.POSIX_OPTION, '-o'),
+            Token(Token.GNU_OPTION, '--longc'),
+            Token(Token.COMMAND, 'command'),
+        ]
+    )
+    posix_option_map, gnu_option_map, command_map, bound_option_values = \
+        ArgvPreprocessor.build_lookup_tables(
+            {
+                tokens['-c']: tokens['--longc'],
+                tokens['--longc']: tokens['--longc'],
+                tokens['-o']: tokens['-o'],
+            },
+            {tokens['-o']},
+            {tokens['command']},
+        )
+    assert {'-c': tokens['--longc'], '-o': tokens['-o']} == posix_option_map
+    assert {'--longc': tokens['--longc']} == gnu_option_map
+    assert {'command': tokens['command']} == command_map
+    assert {'-o'} == bound_option_values
+
+    # generated tables are interned.
+    class GeneratedInfo(TestInfo):
+        posix_option_map = {'-a': Token(Token.POSIX_OPTION, '-a')}
+        gnu_option_map = {}
+        command_map = {'command': Token(Token.COMMAND, 'command')}
+        bound_option_values = set()
+
+    generated_parser = Parser(GeneratedInfo)
+    option = generated_parser.posix_option_map['-a']
+    assert option is Token.intern(Token(Token.POSIX_OPTION, '-a'))
+    assert option is generated_parser.tokenize(['utility_name', '-a'])[0]
+
+
+def test_parse_cache():
+    files = Token(Token.ARGUMENT, '<file>')
+    one_or_more_files = LogicOneOrMore()
+    one_or_more_files.add_child(Argument(files.value))
+    cache = ParseCache(
+        create_parser(create_doc(one_or_more_files), oom_arguments={files}),
+        maxsize=2,
+    )
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+
+    outcome = cache.parse(['utility_name', 'a,b'], mode)
+    assert {'<file>': ['a', 'b']} == outcome
+    # callers get copies.
+    outcome['<file>'].append('c')
+    assert {'<file>': ['a', 'b']} == cache.parse(['other_name', 'a,b'])
+    assert (1, 1, 2, 1) == cache.cache_info()
+
+    # flags affecting outcome are part of the key.
+    outcome = cache.parse(['utility_name', 'a,b'], mode | GUIDELINE_8_OFF)
+    assert {'<file>': ['a,b']} == outcome
+    # rejected argv is cached, the least recently used one is evicted.
+    assert cache.parse(['utility_name'], mode) is False
+    assert cache.parse(['utility_name'], mode) is False
+    assert (2, 3, 2, 2) == cache.cache_info()
+    cache.parse(['utility_name', 'a,b'], mode)
+    assert (2, 4, 2, 2) == cache.cache_info()
+
+    cache.cache_clear()
+    assert (0, 0, 2, 0) == cache.cache_info()
+
+
+def test_grammar_cache():
+    files = Token(Token.ARGUMENT, '<file>')
+    option = Token(Token.POSIX_OPTION, '-o')
+    builds = []
+
+    class CachedInfo(Info):
+        doc_text = 'Usage: utility_name [-o] <file>...'
+
+    def build_grammar():
+        builds.append(True)
+        optional_option = LogicOptional()
+        optional_option.add_child(PosixOption(option.value))
+        one_or_more_files = LogicOneOrMore()
+        one_or_more_files.add_child(Argument(files.value))
+        logic_and = LogicAnd()
+        logic_and.add_child(optional_option)
+        logic_and.add_child(one_or_more_files)
+        CachedInfo.doc_node = create_doc(logic_and)
+        for name, value in [
+                ('bound_options', set()),
+                ('unbound_options', {option}),
+                ('arguments', set()),
+                ('oom_bound_options', set()),
+                ('oom_arguments', {files}),
+                ('commands', set()),
+                ('default_values', {}),
+                ('option_to_representative_option', {option: option})]:
+            setattr(CachedInfo, name, value)
+
+    directory = tempfile.mkdtemp()
+    try:
+        module_path = os.path.join(directory, 'clidoc_cached.py')
+        argv = ['utility_name', 'a', '-o', 'b']
+        expected = {'-o': True, '<file>': ['a', 'b']}
+
+        assert not load_cached_grammar(CachedInfo, build_grammar, module_path)
+        assert os.path.exists(get_grammar_cache_path(module_path))
+        assert expected == Parser(CachedInfo).parse(argv)
+
+        CachedInfo.doc_node = None
+        assert load_cached_grammar(CachedInfo, build_grammar, module_path)
+        assert 1 == len(builds)
+        assert {option} == CachedInfo.unbound_options
+        assert expected == Parser(CachedInfo).parse(argv)
+
+        # invalidated by doc text.
+        CachedInfo.doc_text = 'Usage: utility_name -o <file>...'
+        assert not load_cached_grammar(CachedInfo, build_grammar, module_path)
+        assert 2 == len(builds)
+
+        # invalidated by code of the builder, e.g. a module regenerated by
+        # another front end.
+        def rebuild_grammar():
+            build_grammar()
+            CachedInfo.default_values = {files: 'a.txt'}
+        assert load_cached_grammar(CachedInfo, build_grammar, module_path)
+        assert not load_cached_grammar(CachedInfo, rebuild_grammar,
+                                       module_path)
+        assert {files: 'a.txt'} == CachedInfo.default_values
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_runtime_mode():
+    import clidoc.codegen
+    import clidoc_command
+    import clidoc_logic
+
+    # engine is shared, grammar is not.
+    for module in [clidoc_command, clidoc_logic]:
+        assert module.Parser is clidoc.codegen.Parser
+        assert issubclass(module.Info, clidoc.codegen.Info)
+        assert module.Info.doc_node is not None
+    assert clidoc_command.Info.doc_node is not clidoc_logic.Info.doc_node
+    assert clidoc.codegen.Info.doc_node is None
+
+
+def test_lazy_branch():
+    commands = [Token(Token.COMMAND, 'cmd-{0}'.format(index))
+                for index in range(3)]
+    files = Token(Token.ARGUMENT, '<file>')
+
+    def create_branch(command):
+        logic_and = LogicAnd()
+        logic_and.add_child(Command(command.value))
+        logic_and.add_child(Argument(files.value))
+        return logic_and
+
+    class EagerInfo(Info):
+        bound_options = set()
+        unbound_options = set()
+        arguments = {files}
+        oom_bound_options = set()
+        oom_arguments = set()
+        commands = None
+        default_values = {}
+        option_to_representative_option = {}
+    EagerInfo.commands = set(commands)
+    EagerInfo.doc_node = create_doc(*map(create_branch, commands))
+
+    class LazyInfo(Info):
+        pass
+    load_grammar(LazyInfo, dump_grammar(EagerInfo))
+    branches = LazyInfo.doc_node.get_forward_child()._children
+    assert all(isinstance(branch, LazyBranch) for branch in branches)
+
+    materialized = []
+    for branch in branches:
+        def materialize(branch=branch):
+            materialized.append(branch._command)
+            return LazyBranch.materialize(branch)
+        branch.materialize = materialize
+
+    lazy_parser = Parser(LazyInfo)
+    eager_parser = Parser(EagerInfo)
+    mode = SYSTEM_EXIT_OFF | PRINT_DOC_OFF
+    for argv in [['utility_name', 'cmd-1', 'a'],
+                 ['utility_name', 'a', 'cmd-1'],
+                 ['utility_name', 'cmd-1'],
+                 ['utility_name', 'cmd-3', 'a']]:
+        assert (eager_parser.parse(argv, mode)
+                == lazy_parser.parse(argv, mode))
+    # only the branch of `cmd-1` is materialized, once.
+    assert ['cmd-1'] == materialized
+
+
+def test_parse_many():
+    files = Token(Token.ARGUMENT, '<file>')
+    one_or_more_files = LogicOneOrMore()
+    one_or_more_files.add_child(Argument(files.value))
+    batch_parser = create_parser(
+        create_doc(one_or_more_files), oom_arguments={files},
+    )
+    argv_list = [
+        ['utility_name', 'a,b'],
+        ['utility_name'],
+        ['utility_name', 'c'],
+    ]
+
+    results = batch_parser.parse_many(iter(argv_list))
+    assert {'<file>': ['a', 'b']} == next(results)
+    failure = next(results)
+    assert isinstance(failure, ParseFailure) and not failure
+    assert (1, ParseFailure.NO_ARGUMENT) == (failure.index, failure.reason)
+    assert argv_list[1] is failure.argv
+    assert {'<file>': ['c']} == next(results)
+
+    results = list(batch_parser.parse_many(argv_list, GUIDELINE_8_OFF))
+    assert {'<file>': ['a,b']} == results[0]
+    # outcomes are independent.
+    assert results[0]['<file>'] is not results[2]['<file>']
+
+    other_parser = create_parser(create_doc(Command('command')),
+                                 commands={Token(Token.COMMAND, 'command')})
+    failure, = other_parser.parse_many([['utility_name', 'other']])
+    assert ParseFailure.MISMATCH == failure.reason
+
+    # a reused manager gives the same outcomes as fresh ones.
+    import clidoc_option_binding
+    reused_parser = clidoc_option_binding.Parser(clidoc_option_binding.Info)
+    argv_list = [
+        ['u', '-e', 'a', 'command', '-e', 'b', 'c'],
+        ['u', '-dval', '--', 'a'],
+        ['u', '--no-such-option'],
+        ['u', '-e', 'a', 'command', '-e', 'b', 'c'],
+        ['u', '-c', 'a', 'b'],
+        ['u', '-dx', '--', 'a', 'b'],
+    ]
+    expected = [reused_parser.parse_result(argv) for argv in argv_list]
+    results = list(reused_parser.parse_many(argv_list))
+    assert [bool(outcome) for outcome in expected] == [
+        bool(outcome) for outcome in results
+    ]
+    assert [outcome for outcome in expected if outcome] == [
+        outcome for outcome in results if outcome
+    ]
+    assert results[0] is not results[3]
+
+
+def test_parse_parallel():
+    files = Token(Token.ARGUMENT, '<file>')
+    one_or_more_files = LogicOneOrMore()
+    one_or_more_files.add_child(Argument(files.value))
+    batch_parser = create_parser(
+        create_doc(one_or_more_files), oom_arguments={files},
+    )
+    argv_list = [['utility_name', str(index)] for index in range(50)]
+    argv_list[7] = ['utility_name']
+    expected = list(batch_parser.parse_many(argv_list))
+
+    results = list(batch_parser.parse_parallel(
+        iter(argv_list), workers=2, chunksize=4,
+    ))
+    assert expected[:7] + expected[8:] == results[:7] + results[8:]
+    assert (7, ParseFailure.NO_ARGUMENT) == (results[7].index,
+                                             results[7].reason)
+
+    results = sorted(batch_parser.parse_parallel(
+        argv_list, workers=2, chunksize=4, ordered=False,
+    ), key=lambda item: item[0])
+    assert list(range(50)) == [index for index, _ in results]
+    assert expected[0] == results[0][1]
+
+    # stop early.
+    results = batch_parser.parse_parallel(argv_list, workers=2)
+    assert expected[0] == next(results)
+    results.close()
+
+    # input is read as outcomes are consumed.
+    num_read = [0]
+
+    def generate_argv():
+        for index in range(100000):
+            num_read[0] += 1
+            yield ['utility_name', str(index)]
+
+    for ordered in [True, False]:
+        num_read[0] = 0
+        results = batch_parser.parse_parallel(
+            generate_argv(), workers=2, chunksize=4, ordered=ordered,
+        )
+        next(results)
+        # at most 2 chunks per worker are pending.
+        assert num_read[0] <= 2 * 2 * 4
+        results.close()
+
+
+def test_match_prefix():
+    build = Token(Token.COMMAND, 'build')
+    target = Token(Token.ARGUMENT, '<target>')
+    output = Token(Token.POSIX_OPTION, '-o')
+    include = Token(Token.POSIX_OPTION, '-I')
+    verbose = Token(Token.POSIX_OPTION, '-v')
+
+    build_branch = LogicAnd()
+    build_branch.add_child(Command(build.value))
+    build_branch.add_child(Argument(target.value))
+    output_branch = PosixOption(output.value)
+    one_or_more_include = LogicOneOrMore()
+    one_or_more_include.add_child(PosixOption(include.value))
+    include_branch = LogicAnd()
+    include_branch.add_child(one_or_more_include)
+    include_branch.add_child(PosixOption(verbose.value))
+    prefix_parser = create_parser(
+        create_doc(build_branch, output_branch, include_branch),
+        commands={build}, arguments={target}, bound_options={output},
+        oom_bound_options={include}, unbound_options={verbose},
+        option_to_representative_option=dict(
+            (option, option) for option in (output, include, verbose)
+        ),
+    )
+
+    state = prefix_parser.match_prefix(['utility_name'])
+    assert isinstance(state, PrefixState)
+    assert (0, 1, 2) == state.alive
+    assert {build, output, include, verbose} == state.next_keys
+    assert state.accepts_argument
+
+    state = prefix_parser.match_prefix(['utility_name', 'build', 'a'])
+    assert (0,) == state.alive
+    assert build_branch is state.branches[0]
+    assert not state.next_keys and not state.accepts_argument
+    # wait for the value.
+    state = prefix_parser.match_prefix(['utility_name', '-o'])
+    assert (1,) == state.alive
+    assert not state.next_keys and state.accepts_argument
+    state = prefix_parser.match_prefix(['utility_name', '-o', 'a'])
+    assert not state.next_keys and not state.accepts_argument
+    assert () == prefix_parser.match_prefix(
+        ['utility_name', '-o', 'a', 'b'],
+    ).alive
+
+    # "-v" in the run of "-I" is a general element.
+    argv = ['utility_name', '-I', 'a', '-v']
+    state = prefix_parser.match_prefix(argv)
+    assert (2,) == state.alive
+    assert {include, verbose} == state.next_keys
+    # until the next "-I".
+    state = prefix_parser.match_prefix(argv + ['-I', 'b'])
+    assert {include} == state.next_keys
+    assert state.accepts_argument
+    # retyped as well.
+    assert (2,) == prefix_parser.match_prefix(argv + ['-I', 'b', '-o']).alive
+
+    # extend cached states.
+    matcher = prefix_parser._prefix_matcher
+    matcher.cache_clear()
+    state = prefix_parser.match_prefix(argv)
+    assert 4 == matcher.cache_info().currsize
+    assert state is prefix_parser.match_prefix(argv)
+    longer_state = prefix_parser.match_prefix(argv + ['b'])
+    assert state is longer_state._parent
+    assert (1, 2) == matcher.cache_info()[:2]
+
+    # the run of an oom bound option continues after "--".
+    import clidoc_option_binding
+    binding_parser = clidoc_option_binding.Parser(clidoc_option_binding.Info)
+    assert binding_parser.parse_result(['u', '-dval', '--', 'a'])
+    state = binding_parser.match_prefix(['u', '-dval', '--'])
+    assert not state.next_keys and state.accepts_argument
+
+
+def test_instrumented_parser():
+    files = Token(Token.ARGUMENT, '<file>')
+    verbose = Token(Token.POSIX_OPTION, '-v')
+
+    class StatsInfo(Info):
+        bound_options = set()
+        unbound_options = {verbose}
+        arguments = set()
+        oom_bound_options = set()
+        oom_arguments = {files}
+        commands = set()
+        default_values = {}
+        option_to_representative_option = {verbose: verbose}
+
+    def create_doc_node():
+        one_or_more_files = LogicOneOrMore()
+        one_or_more_files.add_child(Argument(files.value))
+        optional_verbose = LogicOptional()
+        optional_verbose.add_child(PosixOption(verbose.value))
+        logic_and = LogicAnd()
+        logic_and.add_child(optional_verbose)
+        logic_and.add_child(one_or_more_files)
+        return create_doc(logic_and)
+
+    StatsInfo.doc_node = create_doc_node()
+    instrumented_parser = InstrumentedParser(StatsInfo)
+    plain_parser = Parser(StatsInfo)
+    argv = ['utility_name', 'a', '-v', 'b']
+    assert (plain_parser.parse_result(argv)
+            == instrumented_parser.parse_result(argv))
+
+    last, total = instrumented_parser.get_stats()
+    assert 1 == last.parses == total.parses
+    assert {
+        'Doc': 1, 'LogicXor': 1, 'LogicAnd': 1, 'LogicOptional': 1,
+        'PosixOption': 1, 'LogicOneOrMore': 1,
+    } == last.node_matches
+    # pushed by `LogicXor` and `LogicAnd`.
+    assert 2 == last.rollback_points and 0 == last.rollbacks
+    assert last.unconsumed_scans > 0 and last.skip_table_probes > 0
+
+    # rejected.
+    instrumented_parser.parse_result(['utility_name', '-v'])
+    last, total = instrumented_parser.get_stats()
+    assert 1 == last.parses and 2 == total.parses
+    assert 1 == last.rollbacks
+    assert 2 * last.rollback_points == total.rollback_points
+    instrumented_parser.clear_stats()
+    assert 0 == instrumented_parser.get_stats().total.parses
+
+    # phases called out of `parse_result` are not recorded.
+    manager = instrumented_parser.create_manager(
+        instrumented_parser.tokenize(argv),
+    )
+    assert instrumented_parser.match(manager) and manager.all_match()
+    assert 1 == manager.stats.parses
+    assert 0 == instrumented_parser.get_stats().total.parses
+
+
+def test_tracing_parser():
+    command = Token(Token.COMMAND, 'command')
+    file_argument = Token(Token.ARGUMENT, '<file>')
+
+    class TraceInfo(Info):
+        bound_options = set()
+        unbound_options = set()
+        arguments = {file_argument}
+        oom_bound_options = set()
+        oom_arguments = set()
+        commands = {command}
+        default_values = {}
+        option_to_representative_option = {}
+
+    # fails after matching "command", hence rolls back.
+    logic_and = LogicAnd()
+    logic_and.add_child(Command(command.value))
+    logic_and.add_child(Argument(file_argument.value))
+    TraceInfo.doc_node = create_doc(logic_and, Command(command.value))
+    tracing_parser = TracingParser(TraceInfo)
+
+    argv = ['utility_name', 'command']
+    result, trace = tracing_parser.trace_parse(argv)
+    assert {'command': True, '<file>': ''} == result
+    assert tracing_parser.last_trace is None
+    assert result == tracing_parser.parse_result(argv)
+    assert tracing_parser.last_trace is not None
+
+    events = json.loads(trace.to_json())['traceEvents']
+    assert all(event['ph'] in 'BEi' for event in events)
+    assert ['parse', 'fill_tokens', 'fill_tokens'] == [
+        event['name'] for event in events[:3]
+    ]
+    assert {'matched': True} == events[-1]['args']
+    # spans are nested.
+    stack = []
+    for event in events:
+        if event['ph'] == 'B':
+            stack.append(event['name'])
+        elif event['ph'] == 'E':
+            assert stack.pop() == event['name']
+    assert not stack
+    names = [event['name'] for event in events]
+    assert 'Argument <file>' in names
+    rollback_index = names.index('rollback')
+    assert 'Argument <file>' == names[rollback_index - 1]
+    # outcome, consumed flag and next pointer of "command".
+    assert {'undone': 3} == events[rollback_index]['args']
+
+    # phases called out of `trace_parse` are not traced.
+    manager = tracing_parser.create_manager(tracing_parser.tokenize(argv))
+    assert tracing_parser.match(manager) and manager.all_match()
+    assert not manager.trace.events
+
+    # bytes argv is recorded decoded.
+    result, bytes_trace = tracing_parser.trace_parse(
+        [b'utility_name', b'command'],
+    )
+    assert result
+    bytes_events = json.loads(bytes_trace.to_json())['traceEvents']
+    assert argv == bytes_events[0]['args']['argv']
+
+    directory = tempfile.mkdtemp()
+    try:
+        trace_path = os.path.join(directory, 'trace.json')
+        trace.dump(trace_path)
+        with open(trace_path) as trace_file:
+            assert events == json.load(trace_file)['traceEvents']
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from clidoc.completion import (load_parser, complete, CompletionServer,
+                               request_completion)
+
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_test_parser(doc_name):
+    return load_parser(
+        os.path.join(TESTS_DIRECTORY, 'clidoc_{0}.py'.format(doc_name)),
+    )
+
+
+def test_complete():
+    parser = load_test_parser('option_binding')
+    # "command" could be the value of <p3>.
+    assert ['-c', '-e'] == complete(parser, ['command'])
+    # oom bound option could be repeated.
+    assert ['-e'] == complete(parser, ['command', '-e', 'a'])
+    # wait for value of bound option.
+    assert [] == complete(parser, ['-a'])
+    assert ['--long-1', '--long-2', '--long-3', '--long-4'] == complete(
+        parser, [], '--',
+    )
+
+    parser = load_test_parser('argument')
+    # "command1" could be the value of ARG1 or <arg2>.
+    assert ['command2', 'flag-1', 'flag-2'] == complete(
+        parser, ['command1'],
+    )
+    assert ['flag-1', 'flag-2'] == complete(parser, [], 'flag')
+    assert ['flag-2'] == complete(parser, ['flag-1'])
+    assert [] == complete(parser, ['flag-1', 'flag-2'])
+
+
+def test_completion_server():
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, 'completion.sock')
+    server = CompletionServer(socket_path, {
+        'argument': load_test_parser('argument'),
+    })
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        assert ['flag-1', 'flag-2'] == request_completion(
+            socket_path, 'argument', [], 'flag',
+        )
+        assert ['command2'] == request_completion(
+            socket_path, 'argument', ['command1'], 'command',
+        )
+        assert [] == request_completion(socket_path, 'unknown', [])
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    try:
+        # stale socket is replaced.
+        CompletionServer(socket_path, {}).server_close()
+
+        # other files are kept.
+        file_path = os.path.join(directory, 'completion.txt')
+        with open(file_path, 'w') as regular_file:
+            regular_file.write('keep')
+        with pytest.raises(OSError):
+            CompletionServer(file_path, {})
+        with open(file_path) as regular_file:
+            assert 'keep' == regular_file.read()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import io
+import os
+import re
+
+from clidoc.postprocess import postprocess, RUNTIME_HEADER_PATH
+
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ENGINE_PATH = os.path.join(
+    os.path.dirname(TESTS_DIRECTORY), 'clidoc', 'codegen.py',
+)
+
+
+def read(path):
+    with io.open(path, encoding='utf-8') as source_file:
+        return source_file.read()
+
+
+# return `text` of a generated module as written by the front end, i.e.
+# the embedded engine followed by flat grammar statements.
+def flatten(text):
+    start = re.search(r'^Info\.', text, re.M).start()
+    tail = text[start:]
+    tail = re.sub(r'    Info\.\w+_map = \{\n.*?    \}\n', '', tail,
+                  flags=re.S)
+    tail = re.sub(r'    Info\.bound_option_values = set\(\[\n.*?    \]\)\n',
+                  '', tail, flags=re.S)
+    tail = tail.replace('def build_grammar():\n', '')
+    tail = tail.replace(
+        'load_cached_grammar(Info, build_grammar, __file__)\n', '',
+    )
+    tail = re.sub(r'^    ', '', tail, flags=re.M)
+    return read(ENGINE_PATH) + tail
+
+
+def test_postprocess():
+    runtime_header = read(RUNTIME_HEADER_PATH)
+    for doc_name, header in [('simple_option', None),
+                             ('option_binding', runtime_header),
+                             ('logic', runtime_header)]:
+        text = read(os.path.join(
+            TESTS_DIRECTORY, 'clidoc_{0}.py'.format(doc_name),
+        ))
+        flat_text = flatten(text)
+        flat_tail = flat_text[len(read(ENGINE_PATH)):]
+        assert 'build_grammar' not in flat_tail
+        assert 'posix_option_map' not in flat_tail
+        assert text == postprocess(flat_text, header)
+        # idempotent.
+        assert text == postprocess(text, header)
@@ -32,3 +32,25 @@ def test_option_long_1():
     )
     key_checker(outcome)
     assert outcome["--long-1"]
+
+
+def test_option_cached():
+    for _ in range(2):
+        outcome = clidoc(
+            ["utility_name", "-a"],
+            CLIDOC_TEST_MODE | PARSE_CACHE_ON,
+        )
+        key_checker(outcome)
+        assert outcome["-a"]
+    assert clidoc_cache_info().hits >= 1
+
+
+def test_option_stats():
+    for argv in (["utility_name", "-a"], ["utility_name", "--long-1"]):
+        outcome = clidoc(argv, CLIDOC_TEST_MODE | PARSE_STATS_ON)
+        key_checker(outcome)
+    last, total = clidoc_stats()
+    assert 1 == last.parses
+    assert total.parses >= 2
+    assert total.node_matches["Doc"] >= 2
+    assert total.skip_table_probes >= last.skip_table_probes > 0